@@ -12,405 +12,2484 @@ or implied.
 """
 
 # Import Section
+import argparse
+import csv
+import fcntl
+import gzip
+import hashlib
+import heapq
 import json
+import math
 import os
+import queue
+import random
+import socket
+import sqlite3
+import subprocess
 import sys
-from genie import testbed
-import pandas as pd
+import threading
+import time
+import zlib
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor,
+                                wait)
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from functools import partial
+from itertools import zip_longest
 
+# Genie, pyATS, pandas, NumPy and xlsxwriter take seconds to import, so they
+# are imported in the functions that use them and only when they are used
+
+# number of devices collected at the same time and the number of seconds
+# each device has to connect and run all of its commands
+DEFAULT_WORKERS = 20
+DEFAULT_TIMEOUT = 300
+
+# seconds the raw output of a command is kept in the cache and the number
+# of bytes the cache can grow to
+DEFAULT_CACHE_TTL = 7 * 24 * 60 * 60
+DEFAULT_CACHE_SIZE = 500 * 1024 * 1024
+
+# seconds between the polls of each table in daemon mode, and between the
+# output files the daemon writes
+DEFAULT_INTERVALS = {
+    "cpu_processes": 60,
+    "interfaces": 300,
+    "memory_processes": 300,
+    "ospf_neighbors": 900
+}
+DEFAULT_FLUSH_INTERVAL = 300
+
+# seconds the history is kept for and the number of files it is kept in
+# before they are merged, and the seconds and number of interfaces of the
+# utilization reports
+DEFAULT_HISTORY_AGE = 30 * 24 * 60 * 60
+DEFAULT_HISTORY_CHUNKS = 64
+DEFAULT_WINDOW = 60 * 60
+DEFAULT_TOP = 20
+
+# the seconds of memory history the leak report looks at, the number of the
+# latest samples of each process it fits its slope to, and the fewest
+# samples a process needs to be reported
+DEFAULT_LEAK_WINDOW = 24 * 60 * 60
+DEFAULT_LEAK_SAMPLES = 12
+MIN_LEAK_SAMPLES = 4
+
+# the number of times a device of a sharded collection is tried, and the
+# seconds a worker waits before looking for work again
+DEFAULT_SHARD_ATTEMPTS = 3
+SHARD_POLL_INTERVAL = 5
+
+# the platform label the reports computed from the tables are written under
+REPORT_LABEL = "Fleet"
+
+
+# the columns of each table after the device name and ip address
+INTERFACE_COLUMNS = ["interface", "enabled", "oper_status", "admin_state", "auto_negotiate",
+                     "bandwidth", "mtu", "port_mode", "out_rate", "in_rate"]
+CPU_PROCESS_COLUMNS = ["invoked", "p_id", "process", "runtime", "usecs"]
+MEMORY_PROCESS_COLUMNS = ["p_id", "process", "tty", "allocated", "freed", "holding",
+                          "getbufs", "retbufs"]
+NX_MEMORY_PROCESS_COLUMNS = ["p_id", "process", "allocated", "used"]
+INTERFACE_COUNTER_COLUMNS = ["interface", "bandwidth", "in_rate", "out_rate", "in_rate_pkts",
+                             "out_rate_pkts", "in_errors", "out_errors"]
+INTERFACE_ADDRESS_COLUMNS = ["interface", "address", "prefix_length"]
+PROCESS_MEMORY_COLUMNS = ["p_id", "process", "memory"]
+
+
+class Table:
+    """
+    The rows of one table, stored as a list per column. The device name and
+    ip address are kept once per device together with the number of rows
+    it added, instead of being repeated on every row.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.data = [[] for column in columns]
+        self.devices = []
+
+    def __len__(self):
+        return len(self.data[0])
+
+    def append(self, values):
+        """
+        Add a row with a value for each of the columns, in order. The row
+        belongs to the device passed to the next call of add_device.
+        """
+        for column, value in zip(self.data, values):
+            column.append(value)
+
+    def add_device(self, device, count):
+        """
+        Record that the last count rows added to the table belong to the
+        device. A device with no rows is recorded too, so that the rows it
+        had before can be found to be removed.
+        """
+        self.devices.append((device["name"], device["ip"], count))
+
+    def extend(self, other):
+        """
+        Add the rows of another table with the same columns to this one.
+        """
+        for column, values in zip(self.data, other.data):
+            column.extend(values)
+        self.devices.extend(other.devices)
+
+    def records(self):
+        """
+        Go through the table one row at a time.
+        :return: generator of lists with the device name, ip address and the
+        values of the columns of each row
+        """
+        position = 0
+        for name, ip, count in self.devices:
+            for index in range(position, position + count):
+                yield [name, ip] + [values[index] for values in self.data]
+            position += count
+
+    def rows(self):
+        """
+        Go through the table one row at a time.
+        :return: generator of dictionaries with the device name, ip address
+        and the columns of each row
+        """
+        columns = ["device", "ip"] + self.columns
+        for record in self.records():
+            yield dict(zip(columns, record))
+
+    def to_frame(self):
+        """
+        Create a DataFrame straight from the columns, with the device name
+        and ip address stored as categorical columns.
+        :return: DataFrame with a row for each row of the table
+        """
+        counts = [count for name, ip, count in self.devices]
+        import pandas as pd
+
+        frame = pd.DataFrame(dict(zip(self.columns, self.data)), columns=self.columns)
+        frame.insert(0, "device", categorical([name for name, ip, count in self.devices], counts))
+        frame.insert(1, "ip", categorical([ip for name, ip, count in self.devices], counts))
+        return frame
+
+
+def categorical(values, counts):
+    """
+    Create a categorical column where each of the values is repeated the
+    matching number of times.
+    :return: pandas Categorical
+    """
+    import numpy as np
+    import pandas as pd
+
+    categories = list(dict.fromkeys(values))
+    codes = {value: code for code, value in enumerate(categories)}
+    return pd.Categorical.from_codes(np.repeat([codes[value] for value in values], counts).astype(int),
+                                     categories)
+
+def schema_columns(path, fields):
+    """
+    Find the columns of the rows walk_schema creates for a path and fields.
+    :return: list of column names
+    """
+    return [step[1] for step in path if isinstance(step, tuple)] + [field[0] for field in fields]
+
+def walk_schema(tree, path, fields, keys=(), depth=0):
+    """
+    Go down the nested dictionaries of a Genie output along the path,
+    looking up each level only once. A string in the path is a key that is
+    stepped into, while a ("*", column) step goes through every key of that
+    level and records the key in the column. The fields are read from each
+    dictionary at the end of the path as (column, keys, default), using the
+    first of the keys that is present.
+    :return: generator of lists with the values of the path columns followed
+    by the fields
+    """
+    if depth == len(path):
+        row = list(keys)
+        for column, names, default in fields:
+            for name in names:
+                if name in tree:
+                    row.append(tree[name])
+                    break
+            else:
+                row.append(default)
+        yield row
+        return
+
+    step = path[depth]
+    if isinstance(step, tuple):
+        for key, subtree in tree.items():
+            yield from walk_schema(subtree, path, fields, keys + (key,), depth + 1)
+    elif step in tree:
+        yield from walk_schema(tree[step], path, fields, keys, depth + 1)
+
+# the path from the vrf key of the ospf neighbors output down to each
+# neighbor, and the fields that are read from the neighbor
+OSPF_NEIGHBOR_PATH = [("*", "vrf"), "address_family", "ipv4", "instance", ("*", "process_id"),
+                      "areas", ("*", "area"), "interfaces", ("*", "interface"), "neighbors",
+                      ("*", "neighbor")]
+OSPF_NEIGHBOR_FIELDS = [
+    ("router_id", ["neighbor_router_id"], "n/a"),
+    ("address", ["address"], "n/a"),
+    ("state", ["state"], "n/a"),
+    ("priority", ["priority"], "n/a"),
+    ("dr_ip", ["dr_ip_addr"], "n/a"),
+    ("bdr_ip", ["bdr_ip_addr"], "n/a"),
+    ("dead_time", ["dead_time", "dead_timer"], "n/a")
+]
+OSPF_NEIGHBOR_COLUMNS = schema_columns(OSPF_NEIGHBOR_PATH, OSPF_NEIGHBOR_FIELDS)
 
 def parse_interfaces(interfaces, device):
     """
-    Create a list of dictionaries with the information from each interface.
-    This information includes the device name, ip address, interface name, 
-    whether the interface is enabled, the operating status, admin state, 
-    auto negotiate status, bandwidth, mtu, port mode, output rate, and input 
+    Create a table with the information from each interface. This
+    information includes the device name, ip address, interface name,
+    whether the interface is enabled, the operating status, admin state,
+    auto negotiate status, bandwidth, mtu, port mode, output rate, and input
     rate.
-    :return: list of dictionaries 
-    """
-    interface_list = []
-    for interface in interfaces:
-        interface_info = {}
-        interface_info["device"] = device["name"]
-        interface_info["ip"] = device["ip"]
-        interface_info["interface"] = interface
-        interface_info["enabled"] = interfaces[interface]["enabled"]
-        interface_info["oper_status"] = interfaces[interface]["oper_status"]
-        if "admin_state" in interfaces[interface].keys():
-            interface_info["admin_state"] = interfaces[interface]["admin_state"]
-        else:
-            interface_info["admin_state"] = "n/a"
-        if "auto_negotiate" in interfaces[interface].keys():
-            interface_info["auto_negotiate"] = interfaces[interface]["auto_negotiate"]
-        else:
-            interface_info["auto_negotiate"] = "n/a"
-        if "bandwidth" in interfaces[interface].keys():
-            interface_info["bandwidth"] = interfaces[interface]["bandwidth"]
-        else:
-            interface_info["bandwidth"] = "n/a"
-        if "mtu" in interfaces[interface].keys():
-            interface_info["mtu"] = interfaces[interface]["mtu"]
-        else:
-            interface_info["mtu"] = "n/a"
-        if "port_mode" in interfaces[interface].keys():
-            interface_info["port_mode"] = interfaces[interface]["port_mode"]
-        else:
-            interface_info["port_mode"] = "n/a"
-        if "counters" in interfaces[interface].keys() and "rate" in interfaces[interface]["counters"].keys() and "out_rate_pkts" in interfaces[interface]["counters"]["rate"].keys():
-            interface_info["out_rate"] = interfaces[interface]["counters"]["rate"]["out_rate_pkts"]
-        else:
-            interface_info["out_rate"] = "n/a"
-        if "counters" in interfaces[interface].keys() and "rate" in interfaces[interface]["counters"].keys() and "in_rate_pkts" in interfaces[interface]["counters"]["rate"].keys():
-            interface_info["in_rate"] = interfaces[interface]["counters"]["rate"]["in_rate_pkts"]
-        else:
-            interface_info["in_rate"] = "n/a"
+    :return: Table with a row for each interface
+    """
+    table = Table(INTERFACE_COLUMNS)
+    (interface_col, enabled_col, oper_status_col, admin_state_col, auto_negotiate_col,
+     bandwidth_col, mtu_col, port_mode_col, out_rate_col, in_rate_col) = table.data
+    for interface, interface_info in interfaces.items():
+        interface_col.append(interface)
+        enabled_col.append(interface_info["enabled"])
+        oper_status_col.append(interface_info["oper_status"])
+        admin_state_col.append(interface_info.get("admin_state", "n/a"))
+        auto_negotiate_col.append(interface_info.get("auto_negotiate", "n/a"))
+        bandwidth_col.append(interface_info.get("bandwidth", "n/a"))
+        mtu_col.append(interface_info.get("mtu", "n/a"))
+        port_mode_col.append(interface_info.get("port_mode", "n/a"))
+        rate = interface_info.get("counters", {}).get("rate", {})
+        out_rate_col.append(rate.get("out_rate_pkts", "n/a"))
+        in_rate_col.append(rate.get("in_rate_pkts", "n/a"))
+    table.add_device(device, len(interfaces))
+
+    return table
+
+def parse_interface_counters(interfaces, device):
+    """
+    Create a table with the counters of each interface that are kept in the
+    interface history. This information includes the interface name, the
+    bandwidth in kbit/sec, the input and output rates in bits/sec and
+    packets/sec, and the input and output errors. Missing counters are NaN.
+    :return: Table with a row for each interface
+    """
+    table = Table(INTERFACE_COUNTER_COLUMNS)
+    (interface_col, bandwidth_col, in_rate_col, out_rate_col, in_rate_pkts_col,
+     out_rate_pkts_col, in_errors_col, out_errors_col) = table.data
+    for interface, interface_info in interfaces.items():
+        interface_col.append(interface)
+        bandwidth_col.append(interface_info.get("bandwidth", math.nan))
+        counters = interface_info.get("counters", {})
+        rate = counters.get("rate", {})
+        in_rate_col.append(rate.get("in_rate", math.nan))
+        out_rate_col.append(rate.get("out_rate", math.nan))
+        in_rate_pkts_col.append(rate.get("in_rate_pkts", math.nan))
+        out_rate_pkts_col.append(rate.get("out_rate_pkts", math.nan))
+        in_errors_col.append(counters.get("in_errors", math.nan))
+        out_errors_col.append(counters.get("out_errors", math.nan))
+    table.add_device(device, len(interfaces))
 
-        interface_list.append(interface_info)
+    return table
 
-    return interface_list
+def parse_interface_addresses(interfaces, device):
+    """
+    Create a table with the IPv4 addresses of each interface, which the OSPF
+    neighbors of the other devices are matched against. This information
+    includes the interface name, the address, and the prefix length.
+    :return: Table with a row for each address
+    """
+    table = Table(INTERFACE_ADDRESS_COLUMNS)
+    interface_col, address_col, prefix_length_col = table.data
+    for interface, interface_info in interfaces.items():
+        for address_info in interface_info.get("ipv4", {}).values():
+            if "ip" in address_info:
+                interface_col.append(interface)
+                address_col.append(address_info["ip"])
+                prefix_length_col.append(address_info.get("prefix_length", "n/a"))
+    table.add_device(device, len(interface_col))
+
+    return table
 
 def parse_cpu_process(cpu_processes, device):
     """
-    Create a list of dictionaries with the information from the cpu 
-    processes. This information includes the device name, ip address, 
-    the process id, process name, whether the process is invoked, the 
-    runtime, and usecs.
-    :return: list of dictionaries
-    """
-    cpu_process_list = []
-    for key in cpu_processes:
-            cpu_process_info = {}
-            cpu_process_info["device"] = device["name"]
-            cpu_process_info["ip"] = device["ip"]
-            cpu_process_info["invoked"] = cpu_processes[key]["invoked"]
-            cpu_process_info["p_id"] = cpu_processes[key]["pid"]
-            cpu_process_info["process"] = cpu_processes[key]["process"]
-            if "runtime_ms" in cpu_processes[key].keys():
-                cpu_process_info["runtime"] = cpu_processes[key]["runtime_ms"]
-            elif "runtime" in cpu_processes[key].keys():
-                cpu_process_info["runtime"] = cpu_processes[key]["runtime"]
-            cpu_process_info["usecs"] = cpu_processes[key]["usecs"]
-
-            cpu_process_list.append(cpu_process_info)
-
-    return cpu_process_list
+    Create a table with the information from the cpu processes. This
+    information includes the device name, ip address, the process id,
+    process name, whether the process is invoked, the runtime, and usecs.
+    :return: Table with a row for each process
+    """
+    table = Table(CPU_PROCESS_COLUMNS)
+    invoked_col, p_id_col, process_col, runtime_col, usecs_col = table.data
+    for cpu_process_info in cpu_processes.values():
+        invoked_col.append(cpu_process_info["invoked"])
+        p_id_col.append(cpu_process_info["pid"])
+        process_col.append(cpu_process_info["process"])
+        if "runtime_ms" in cpu_process_info:
+            runtime_col.append(cpu_process_info["runtime_ms"])
+        else:
+            runtime_col.append(cpu_process_info.get("runtime"))
+        usecs_col.append(cpu_process_info["usecs"])
+    table.add_device(device, len(cpu_processes))
+
+    return table
 
 def parse_memory_process(memory_processes, device):
     """
-    Create a list of dictionaries with the information from the memory 
-    processes of the IOS devices. This information includes the device name, 
-    ip address, process id, process name, tty, the amount of memory allocated, 
-    the amount of memory freed, how much is holding, the getbufs, and retbufs.
-    :return: list of dictionaries
-    """
-    memory_process_list = []
-    for key in memory_processes:
-        for index in memory_processes[key]["index"]:
-            memory_process_info = {}
-            memory_process_info["device"] = device["name"]
-            memory_process_info["ip"] = device["ip"]
-            memory_process_info["p_id"] = memory_processes[key]["index"][index]["pid"]
-            memory_process_info["process"] = memory_processes[key]["index"][index]["process"]
-            memory_process_info["tty"] = memory_processes[key]["index"][index]["tty"]
-            memory_process_info["allocated"] = memory_processes[key]["index"][index]["allocated"]
-            memory_process_info["freed"] = memory_processes[key]["index"][index]["freed"]
-            memory_process_info["holding"] = memory_processes[key]["index"][index]["holding"]
-            memory_process_info["getbufs"] = memory_processes[key]["index"][index]["getbufs"]
-            memory_process_info["retbufs"] = memory_processes[key]["index"][index]["retbufs"]
-            memory_process_list.append(memory_process_info)
-
-    return memory_process_list
+    Create a table with the information from the memory processes of the
+    IOS devices. This information includes the device name, ip address,
+    process id, process name, tty, the amount of memory allocated, the
+    amount of memory freed, how much is holding, the getbufs, and retbufs.
+    :return: Table with a row for each process
+    """
+    table = Table(MEMORY_PROCESS_COLUMNS)
+    (p_id_col, process_col, tty_col, allocated_col, freed_col, holding_col,
+     getbufs_col, retbufs_col) = table.data
+    for memory_process in memory_processes.values():
+        for memory_process_info in memory_process["index"].values():
+            p_id_col.append(memory_process_info["pid"])
+            process_col.append(memory_process_info["process"])
+            tty_col.append(memory_process_info["tty"])
+            allocated_col.append(memory_process_info["allocated"])
+            freed_col.append(memory_process_info["freed"])
+            holding_col.append(memory_process_info["holding"])
+            getbufs_col.append(memory_process_info["getbufs"])
+            retbufs_col.append(memory_process_info["retbufs"])
+    table.add_device(device, len(p_id_col))
+
+    return table
 
 def parse_nx_memory_process(memory_processes, device):
     """
-    Create as list of dictionaries with the information from the memory 
-    processes of the Nexus devices. This information includes the device 
-    name, ip address, process id, process, the amount of memory allocated, 
-    and the amount of memory used.
-    :return: list of dictionaries
-    """
-    memory_process_list = []
-    for key in memory_processes:
-            for index in memory_processes[key]["index"]:
-                    memory_process_info = {}
-                    memory_process_info["device"] = device["name"]
-                    memory_process_info["ip"] = device["ip"]
-                    memory_process_info["p_id"] = memory_processes[key]["index"][index]["pid"]
-                    memory_process_info["process"] = memory_processes[key]["index"][index]["process"]
-                    memory_process_info["allocated"] = memory_processes[key]["index"][index]["mem_alloc"]
-                    memory_process_info["used"] = memory_processes[key]["index"][index]["mem_used"]
-                    memory_process_list.append(memory_process_info)
-
-    return memory_process_list
+    Create a table with the information from the memory processes of the
+    Nexus devices. This information includes the device name, ip address,
+    process id, process, the amount of memory allocated, and the amount of
+    memory used.
+    :return: Table with a row for each process
+    """
+    table = Table(NX_MEMORY_PROCESS_COLUMNS)
+    p_id_col, process_col, allocated_col, used_col = table.data
+    for memory_process in memory_processes.values():
+        for memory_process_info in memory_process["index"].values():
+            p_id_col.append(memory_process_info["pid"])
+            process_col.append(memory_process_info["process"])
+            allocated_col.append(memory_process_info["mem_alloc"])
+            used_col.append(memory_process_info["mem_used"])
+    table.add_device(device, len(p_id_col))
+
+    return table
+
+def parse_process_memory(memory_processes, device):
+    """
+    Create a table with the memory each process of an IOS device is
+    holding, which is kept in the memory history. This information
+    includes the process id, process name, and the amount of memory held.
+    :return: Table with a row for each process
+    """
+    table = Table(PROCESS_MEMORY_COLUMNS)
+    p_id_col, process_col, memory_col = table.data
+    for memory_process in memory_processes.values():
+        for memory_process_info in memory_process["index"].values():
+            p_id_col.append(memory_process_info["pid"])
+            process_col.append(memory_process_info["process"])
+            memory_col.append(memory_process_info.get("holding", math.nan))
+    table.add_device(device, len(p_id_col))
+
+    return table
+
+def parse_nx_process_memory(memory_processes, device):
+    """
+    Create a table with the memory each process of a Nexus device is
+    using, which is kept in the memory history. This information includes
+    the process id, process name, and the amount of memory used.
+    :return: Table with a row for each process
+    """
+    table = Table(PROCESS_MEMORY_COLUMNS)
+    p_id_col, process_col, memory_col = table.data
+    for memory_process in memory_processes.values():
+        for memory_process_info in memory_process["index"].values():
+            p_id_col.append(memory_process_info["pid"])
+            process_col.append(memory_process_info["process"])
+            memory_col.append(memory_process_info.get("mem_used", math.nan))
+    table.add_device(device, len(p_id_col))
+
+    return table
 
 def parse_ospf_neighbor(ospf_neighbors, device):
     """
-    Create a list of dictionaries with the OSPF neighbor information of 
-    each interface. This information includes the device name, ip address, 
-    vrf, process id, area, interface, neighbor, router id, neighbor ip 
-    address, neighbor state, neighbor priority, designated router ip 
-    address, backup designated router ip address, and dead time.
-    :return: list of dictionaries
-    """
-    ospf_neighbor_list = []
-    for vrf in ospf_neighbors:
-        for process in ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"]:
-            for area in ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["area"]:
-                for interface in ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["area"][area]["interfaces"]:
-                    for neighbor in ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["area"][area]["interfaces"][interface]["neighbors"]:
-                        ospf_neighbor_info = {}
-                        ospf_neighbor_info["device"] = device["name"]
-                        ospf_neighbor_info["ip"] = device["ip"]
-                        ospf_neighbor_info["vrf"] = vrf
-                        ospf_neighbor_info["process_id"] = process
-                        ospf_neighbor_info["area"] = area
-                        ospf_neighbor_info["interface"] = interface
-                        ospf_neighbor_info["neighbor"] = neighbor
-                        ospf_neighbor_info["router_id"] = ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["areas"][area]["interfaces"][interface]["neighbors"][neighbor]["neighbor_router_id"]
-                        ospf_neighbor_info["address"] = ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["areas"][area]["interfaces"][interface]["neighbors"][neighbor]["address"]
-                        if "state" in ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["areas"][area]["interfaces"][interface]["neighbors"][neighbor].keys():
-                            ospf_neighbor_info["state"] = ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["areas"][area]["interfaces"][interface]["neighbors"][neighbor]["state"]
-                        else:
-                            ospf_neighbor_info["state"] = "n/a"
-                        if "priority" in ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["areas"][area]["interfaces"][interface]["neighbors"][neighbor].keys():
-                            ospf_neighbor_info["priority"] = ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["areas"][area]["interfaces"][interface]["neighbors"][neighbor]["priority"]
-                        else:
-                            ospf_neighbor_info["priority"] = "n/a"
-                        if "dr_ip_addr" in ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["areas"][area]["interfaces"][interface]["neighbors"][neighbor].keys():
-                            ospf_neighbor_info["dr_ip"] = ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["area"][area]["interfaces"][interface]["neighbors"][neighbor]["dr_ip_addr"]
-                        else:
-                            ospf_neighbor_info["dr_ip"] = "n/a"
-                        if "bdr_ip_addr" in ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["area"][area]["interfaces"][interface]["neighbors"][neighbor].keys():
-                            ospf_neighbor_info["bdr_ip"] = ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["areas"][area]["interfaces"][interface]["neighbors"][neighbor]["bdr_ip_addr"]
-                        else:
-                            ospf_neighbor_info["bdr_ip"] = "n/a"
-                        if "dead_time" in ospf_neighbors[vrf]["address_family"]["ipv4"]["instance"][process]["areas"][area]["interfaces"][interface]["neighbors"][neighbor].keys():
-                            ospf_neighbor_info["dead_time"] = ospf_neighbors[interface]["neighbors"][neighbor]["dead_time"]
-                        else:
-                            ospf_neighbor_info["dead_time"] = "n/a"
-                        ospf_neighbor_list.append(ospf_neighbor_info)
-
-    return ospf_neighbor_list
-
-def run_nxos_commands(nxos_devices):
-    """
-    Connect to Nexus devices and run the commands show interface, 
-    show ip ospf neighbors detail, show processes memory, and show 
-    processes cpu. Add the results of running the commands to a 
-    dictionary.
-    :return: dictionary containing lists with the parsed results of 
-    running the commands on each device
-    """
-    nxos_info = {
-        "interfaces": [],
-        "cpu_processes": [],
-        "memory_processes": [],
-        "ospf_neighbors": []
-    }
-    for device in nxos_devices:
-        node = nxos_devices[device]
-        ip_addr = node.connections["cli"]["ip"]
-        device_info = {"name": device, "ip": ip_addr}
-        node.connect(init_exec_commands=[], init_config_commands=[],
-                       log_stdout=False, learn_hostname=True)
-        try:
-            show_interface = node.parse("show interface")
-        except Exception as e:
-            print(f"There was an issue getting the interfaces for {device}")
-            print(e)
-            show_interface = {}
-        try:
-            show_ospf_neighbor = node.parse("show ip ospf neighbors detail")
-        except Exception as e:
-            print(f"There was an issue getting the ospf neighbor information for {device}")
-            print(e)
-            show_ospf_neighbor = {}
+    Create a table with the OSPF neighbor information of each interface.
+    This information includes the device name, ip address, vrf, process
+    id, area, interface, neighbor, router id, neighbor ip address, neighbor
+    state, neighbor priority, designated router ip address, backup
+    designated router ip address, and dead time.
+    :return: Table with a row for each neighbor
+    """
+    table = Table(OSPF_NEIGHBOR_COLUMNS)
+    for row in walk_schema(ospf_neighbors, OSPF_NEIGHBOR_PATH, OSPF_NEIGHBOR_FIELDS):
+        table.append(row)
+    table.add_device(device, len(table))
+
+    return table
+
+# the commands run on each platform: the key of the Genie output that holds
+# the rows, the function that flattens them, and the table they are added to,
+# along with the tables that are only used for the history and the reports
+NXOS_COMMANDS = [
+    {"command": "show interface", "description": "interfaces", "key": None,
+     "parser": parse_interfaces, "table": "interfaces",
+     "history_tables": {"interface_counters": parse_interface_counters,
+                        "interface_addresses": parse_interface_addresses}},
+    {"command": "show ip ospf neighbors detail", "description": "ospf neighbor information",
+     "key": "vrf", "parser": parse_ospf_neighbor, "table": "ospf_neighbors"},
+    {"command": "show processes memory", "description": "memory information", "key": "pid",
+     "parser": parse_nx_memory_process, "table": "memory_processes",
+     "history_tables": {"process_memory": parse_nx_process_memory}},
+    {"command": "show processes cpu", "description": "cpu processes", "key": "index",
+     "parser": parse_cpu_process, "table": "cpu_processes"}
+]
+
+IOS_COMMANDS = [
+    {"command": "show interfaces", "description": "interfaces", "key": None,
+     "parser": parse_interfaces, "table": "interfaces",
+     "history_tables": {"interface_counters": parse_interface_counters,
+                        "interface_addresses": parse_interface_addresses}},
+    {"command": "show ip ospf neighbor detail", "description": "ospf neighbor information",
+     "key": "vrf", "parser": parse_ospf_neighbor, "table": "ospf_neighbors"},
+    {"command": "show processes memory", "description": "memory information", "key": "pid",
+     "parser": parse_memory_process, "table": "memory_processes",
+     "history_tables": {"process_memory": parse_process_memory}},
+    {"command": "show processes cpu", "description": "cpu processes", "key": "index",
+     "parser": parse_cpu_process, "table": "cpu_processes"}
+]
+
+# the platforms that can be collected, keyed by the os of the testbed entry;
+# platforms with the same label share the same sheets in the Excel file
+PLATFORMS = {
+    "nxos": {"label": "NXOS", "commands": NXOS_COMMANDS},
+    "ios": {"label": "IOS", "commands": IOS_COMMANDS},
+    "iosxe": {"label": "IOS", "commands": IOS_COMMANDS}
+}
+
+# the tables every platform is collected into and the title of their sheets
+TABLES = {
+    "interfaces": "Interfaces",
+    "cpu_processes": "CPU Processes",
+    "memory_processes": "Memory Processes",
+    "ospf_neighbors": "OSPF Neighbors"
+}
+
+class Profiler:
+    """
+    The time spent in every stage of the collection, by device and command:
+    connecting, running the commands, parsing them with Genie, flattening
+    them into tables and writing the tables. Every timing and error is
+    written as a JSON line to the profile file when one is opened, and the
+    totals are kept for the summary and the Prometheus metrics.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.file = None
+        self.captured_records = None
+        # the number of calls, seconds and errors of every device, stage and command
+        self.totals = {}
+
+    def open(self, path):
+        # line buffered, so every record is on disk as soon as it is written
+        self.file = open(path, "a", buffering=1)
+
+    def capture(self):
+        """
+        Keep the timings recorded from now on in memory instead of adding
+        them to the totals, so a parser process can send them back to the
+        main process.
+        """
+        self.captured_records = []
+
+    def captured(self):
+        """
+        Take the timings kept since capture was called.
+        :return: list of tuples with the arguments of record
+        """
+        records = self.captured_records
+        self.captured_records = []
+        return records
+
+    def record(self, stage, device, command, seconds, error=None):
+        """
+        Add a timing or an error to the profile.
+        """
+        if self.captured_records is not None:
+            self.captured_records.append((stage, device, command, seconds,
+                                          None if error is None else str(error)))
+            return
+        key = (device, stage, command)
+        with self.lock:
+            totals = self.totals.setdefault(key, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            if error is not None:
+                totals[2] += 1
+            if self.file:
+                self.file.write(json.dumps({"time": time.time(), "device": device,
+                                            "stage": stage, "command": command,
+                                            "seconds": seconds, "ok": error is None,
+                                            "error": None if error is None else str(error)})
+                                + "\n")
+
+    @contextmanager
+    def timed(self, stage, device=None, command=None):
+        """
+        Time the code run in the with block. An exception raised in the
+        block is recorded as an error and raised again.
+        """
+        start = time.perf_counter()
         try:
-            show_memory = node.parse("show processes memory")
+            yield
         except Exception as e:
-            print(f"There was an issue getting the memory information for {device}")
-            print(e)
-            show_memory = {}
+            self.record(stage, device, command, time.perf_counter() - start, e)
+            raise
+        self.record(stage, device, command, time.perf_counter() - start)
+
+    def error(self, stage, device, command, error):
+        self.record(stage, device, command, 0.0, error)
+
+    def slowest(self, by, top=DEFAULT_TOP):
+        """
+        Add up the seconds of the totals by the positions of the key given.
+        :return: list of tuples with the key and the seconds, slowest first
+        """
+        seconds = {}
+        with self.lock:
+            for key, (calls, total, errors) in self.totals.items():
+                group = tuple(key[position] for position in by)
+                seconds[group] = seconds.get(group, 0.0) + total
+        return sorted(seconds.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    def print_summary(self, top=10):
+        """
+        Print the devices and the commands that took the longest.
+        """
+        print("Slowest devices:")
+        for (device,), seconds in self.slowest([0], top):
+            if device is not None:
+                print(f"  {device}: {seconds:.2f}s")
+        print("Slowest stages and commands:")
+        for (stage, command), seconds in self.slowest([1, 2], top):
+            print(f"  {stage} {command or ''}: {seconds:.2f}s")
+        errors = sum(totals[2] for totals in self.totals.values())
+        print(f"Errors: {errors}")
+
+    def metrics(self):
+        """
+        Create the Prometheus text exposition of the totals.
+        :return: string with the metrics
+        """
+        lines = []
+        names = [("calls", "counter", 0), ("seconds", "counter", 1), ("errors", "counter", 2)]
+        with self.lock:
+            totals = list(self.totals.items())
+        for name, metric_type, position in names:
+            lines.append(f"# TYPE network_analytics_{name}_total {metric_type}")
+            for (device, stage, command), values in totals:
+                labels = ",".join(f'{label}="{label_value(value)}"' for label, value
+                                  in [("device", device), ("stage", stage), ("command", command)])
+                lines.append(f"network_analytics_{name}_total{{{labels}}} {values[position]}")
+        return "\n".join(lines) + "\n"
+
+
+def label_value(value):
+    """
+    Escape a value for a label of the Prometheus text exposition.
+    :return: the escaped value, empty for None
+    """
+    if value is None:
+        return ""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def serve_metrics(port):
+    """
+    Serve the metrics of the profiler to Prometheus on a port, from a
+    background thread.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            body = profiler.metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+# the timings of the current run
+profiler = Profiler()
+
+class InventoryDevice:
+    """
+    A device of the testbed file read without pyATS, with the attributes
+    the collection uses: its name, os, connections and custom section. It
+    cannot connect, so it is only used when the outputs come from the
+    cache, and it parses them with the Genie device of its os.
+    """
+
+    def __init__(self, name, details):
+        self.name = name
+        self.os = details.get("os")
+        self.connections = details.get("connections", {})
+        self.custom = details.get("custom", {})
+
+    def parse(self, command, output):
+        return parser_device(self.os).parse(command, output=output)
+
+
+def load_devices(path, offline=False, names=None, sites=None):
+    """
+    Read the devices of the testbed file and keep those of the platforms in
+    PLATFORMS, of the names and of the sites given. The file is read as
+    plain YAML to filter the devices, and pyATS is only loaded when the
+    devices are connected to, in which case the testbed is loaded with
+    pyATS so that its markup and defaults are applied.
+    :return: dictionary with the devices by name
+    """
+    import yaml
+
+    with open(path) as testbed_file:
+        testbed_devices = (yaml.safe_load(testbed_file) or {}).get("devices") or {}
+    selected = []
+    for device, details in testbed_devices.items():
+        details = details or {}
+        if details.get("os") not in PLATFORMS:
+            continue
+        if names and device not in names:
+            continue
+        if sites and (details.get("custom") or {}).get("site", "default") not in sites:
+            continue
+        selected.append(device)
+
+    if offline:
+        return {device: InventoryDevice(device, testbed_devices[device]) for device in selected}
+
+    from genie import testbed
+
+    devices = testbed.load(path).devices
+    return {device: devices[device] for device in selected}
+
+def device_details(device, node):
+    """
+    Find the name and ip address the rows of a device are recorded with.
+    :return: dictionary with the name and ip address
+    """
+    return {"name": device, "ip": node.connections["cli"]["ip"]}
+
+def device_site(node):
+    """
+    Find the site a device belongs to. The site is read from the custom
+    section of the testbed entry for the device, so devices without one
+    all share the same default site.
+    :return: name of the site
+    """
+    custom = getattr(node, "custom", None) or {}
+    return custom.get("site", "default")
+
+class OutputCache:
+    """
+    The raw output of the commands run on the devices, stored on disk under
+    the hash of its content so that identical outputs are only kept once. An
+    index records the device, command and time of every output, and the
+    latest output of every device and command is kept in a dictionary so it
+    is found without going through the index. Outputs older than the ttl
+    are removed, and the oldest outputs are removed when the cache grows
+    over max_size bytes.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_CACHE_TTL, max_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        index_path = os.path.join(path, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path) as index_file:
+                self.entries = json.load(index_file)
+        else:
+            self.entries = []
+        self.index_latest()
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+
+    def index_latest(self):
+        """
+        Find the latest entry of every device and command in the index.
+        """
+        self.latest = {}
+        for entry in self.entries:
+            self.add_latest(entry)
+
+    def add_latest(self, entry):
+        key = (entry["device"], entry["command"])
+        if key not in self.latest or entry["timestamp"] >= self.latest[key]["timestamp"]:
+            self.latest[key] = entry
+
+    def object_path(self, digest):
+        return os.path.join(self.path, "objects", digest[:2], digest)
+
+    def store(self, device, command, output):
+        """
+        Save the output of a command run on a device.
+        """
+        data = output.encode()
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self.object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            temp_path = f"{object_path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as object_file:
+                object_file.write(data)
+            os.replace(temp_path, object_path)
+        entry = {"device": device, "command": command, "timestamp": time.time(),
+                 "hash": digest, "size": len(data)}
+        with self.lock:
+            self.entries.append(entry)
+            self.add_latest(entry)
+
+    def load(self, device, command):
+        """
+        Find the most recent output of a command run on a device that has
+        not expired.
+        :return: the output, or None if it is not in the cache
+        """
+        with self.lock:
+            entry = self.latest.get((device, command))
+        if entry is None or entry["timestamp"] < time.time() - self.ttl:
+            return None
         try:
-            show_cpu = node.parse("show processes cpu")
-        except Exception as e:
-            print(f"There was an issue getting the cpu processes for {device}")
-            print(e)
-            show_cpu = {}
+            with open(self.object_path(entry["hash"]), "rb") as object_file:
+                return object_file.read().decode()
+        except FileNotFoundError:
+            return None
+
+    def save(self):
+        """
+        Remove the expired and oldest outputs and write the index to disk.
+        The index is locked while it is written and merged with the outputs
+        other processes saved to it in the meantime, so that several
+        processes can share the cache.
+        """
+        index_path = os.path.join(self.path, "index.json")
+        oldest = time.time() - self.ttl
+        with self.lock, open(os.path.join(self.path, "index.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = {}
+            if os.path.exists(index_path):
+                with open(index_path) as index_file:
+                    saved_entries = json.load(index_file)
+            else:
+                saved_entries = []
+            for entry in saved_entries + self.entries:
+                entries[(entry["device"], entry["command"], entry["timestamp"])] = entry
+            entries = sorted(entries.values(), key=lambda entry: entry["timestamp"])
+
+            # remove the expired outputs, then the oldest ones until the
+            # outputs still in use fit in the cache
+            removed = {entry["hash"] for entry in entries if entry["timestamp"] < oldest}
+            entries = [entry for entry in entries if entry["timestamp"] >= oldest]
+            references = Counter(entry["hash"] for entry in entries)
+            sizes = {entry["hash"]: entry["size"] for entry in entries}
+            total = sum(sizes.values())
+            evicted = 0
+            while evicted < len(entries) and total > self.max_size:
+                digest = entries[evicted]["hash"]
+                references[digest] -= 1
+                if not references[digest]:
+                    total -= sizes[digest]
+                    removed.add(digest)
+                evicted += 1
+            self.entries = entries[evicted:]
+            self.index_latest()
+
+            for digest in removed - {entry["hash"] for entry in self.entries}:
+                try:
+                    os.remove(self.object_path(digest))
+                except FileNotFoundError:
+                    pass
+            with open(f"{index_path}.tmp", "w") as index_file:
+                json.dump(self.entries, index_file)
+            os.replace(f"{index_path}.tmp", index_path)
+
+def execute_command(node, device, command, description, deadline, cache=None):
+    """
+    Run a command on a connected device and keep its raw output in the
+    cache. The command only gets the time the device has left, so a device
+    that hangs cannot hold its worker past its deadline. If the device has
+    used up its time or the command fails, the issue is printed, recorded
+    as an error, and None is returned so the other commands still run.
+    :return: raw output of the command
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        print(f"Timed out before getting the {description} for {device}")
+        profiler.error("execute", device, command, "timed out before the command started")
+        return None
+    try:
+        with profiler.timed("execute", device, command):
+            output = node.execute(command, timeout=max(remaining, 1))
+    except Exception as e:
+        print(f"There was an issue getting the {description} for {device}")
+        print(e)
+        return None
+    if cache:
+        cache.store(device, command, output)
+    return output
+
+def parse_command(node, device, command, description, output):
+    """
+    Parse the raw output of a command with the Genie parser of the device.
+    An output that Genie finds empty, such as a device without any OSPF
+    neighbors, is an empty result. If the output cannot be parsed, the
+    issue is printed and None is returned so the other commands are still
+    parsed.
+    :return: dictionary with the parsed output of the command, or None if
+    the command failed
+    """
+    if output is None:
+        return None
+    try:
+        with profiler.timed("parse", device, command):
+            try:
+                return node.parse(command, output=output)
+            except Exception as e:
+                from genie.metaparser.util.exceptions import SchemaEmptyParserError
+
+                # an empty output is parsed, so it is not recorded as an error
+                if isinstance(e, SchemaEmptyParserError):
+                    return {}
+                raise
+    except Exception as e:
+        print(f"There was an issue parsing the {description} for {device}")
+        print(e)
+        return None
+
+def connect_device(device, node, timeout):
+    """
+    Open the CLI session to a device.
+    """
+    with profiler.timed("connect", device):
+        node.connect(init_exec_commands=[], init_config_commands=[],
+                       log_stdout=False, learn_hostname=True,
+                       connection_timeout=timeout)
+
+def platform_commands(os_name, tables=None):
+    """
+    Find the commands of a platform, or only those of some of its tables.
+    :return: list of the command specs, see PLATFORMS
+    """
+    return [spec for spec in PLATFORMS[os_name]["commands"]
+            if tables is None or spec["table"] in tables]
+
+def parse_outputs(device_info, node, commands, outputs):
+    """
+    Parse the raw outputs of the commands of a device with the Genie parsers
+    of node and flatten them into the tables of the commands. A command that
+    ran but returned nothing gives tables without any rows for the device.
+    :return: dictionary containing a Table for each command that ran on the
+    device
+    """
+    device_tables = {}
+    device = device_info["name"]
+    for spec, output in zip(commands, outputs):
+        output = parse_command(node, device, spec["command"], spec["description"], output)
+        if output is None:
+            continue
+        if spec["key"]:
+            output = output.get(spec["key"], {})
+        with profiler.timed("flatten", device, spec["command"]):
+            device_tables[spec["table"]] = spec["parser"](output, device_info)
+            for table, parser in spec.get("history_tables", {}).items():
+                device_tables[table] = parser(output, device_info)
+
+    return device_tables
+
+def fetch_outputs(device, node, commands, timeout, cache=None, offline=False):
+    """
+    Connect to a device and run the commands. Every command must start
+    before the timeout of the device runs out, and the device is
+    disconnected once they are done. In offline mode the outputs are read
+    from the cache instead and the device is not connected to at all.
+    :return: list with the raw output of each command, None for the
+    commands that failed
+    """
+    outputs = []
+    if offline:
+        for spec in commands:
+            output = cache.load(device, spec["command"])
+            if output is None:
+                print(f"There is no cached output of {spec['command']} for {device}")
+            outputs.append(output)
+        return outputs
+
+    deadline = time.monotonic() + timeout
+    connect_device(device, node, timeout)
+    try:
+        for spec in commands:
+            outputs.append(execute_command(node, device, spec["command"],
+                                           spec["description"], deadline, cache))
+    finally:
         node.disconnect()
+    return outputs
 
-        if show_cpu:
-            cpu_processes = show_cpu["index"]
-        else:
-            cpu_processes = {}
-        if show_memory:
-            memory_processes = show_memory["pid"]
+def poll_outputs(device, node, commands, timeout, cache=None):
+    """
+    Run the commands on a device, reusing its session if it is still open.
+    If none of the commands returned any output the session is closed, so
+    that it is opened again on the next poll.
+    :return: list with the raw output of each command, None for the
+    commands that failed
+    """
+    deadline = time.monotonic() + timeout
+    if not node.is_connected():
+        connect_device(device, node, timeout)
+    outputs = []
+    for spec in commands:
+        outputs.append(execute_command(node, device, spec["command"],
+                                       spec["description"], deadline, cache))
+    if all(output is None for output in outputs):
+        node.disconnect()
+    return outputs
+
+# the Genie devices without a connection that parse the outputs, by os
+parser_devices = {}
+
+def parser_device(os_name):
+    """
+    Find the Genie device that parses the outputs of a platform without
+    connecting to anything, creating it the first time.
+    :return: Genie Device
+    """
+    if os_name not in parser_devices:
+        from genie.conf.base import Device
+
+        node = Device(f"{os_name}-parser", os=os_name)
+        node.custom.setdefault("abstraction", {})["order"] = ["os"]
+        parser_devices[os_name] = node
+    return parser_devices[os_name]
+
+def parse_in_process(device_info, os_name, tables, outputs):
+    """
+    Parse and flatten the raw outputs of a device in a parser process, with
+    a Genie device of the same os that has no connection.
+    :return: tuple of the dictionary of Tables and the timings recorded
+    while parsing, to be added to the profiler of the main process
+    """
+    profiler.capture()
+    device_tables = parse_outputs(device_info, parser_device(os_name),
+                                  platform_commands(os_name, tables), outputs)
+    return device_tables, profiler.captured()
+
+def parse_result(future):
+    """
+    Get the Tables of a finished parse_in_process and add its timings to
+    the profiler.
+    :return: dictionary containing a Table for each command
+    """
+    device_tables, records = future.result()
+    for record in records:
+        profiler.record(*record)
+    return device_tables
+
+def create_parse_executor(parse_workers):
+    """
+    Start the processes the outputs are parsed in, or none if parse_workers
+    is 0 and the outputs are parsed by the threads that collect them.
+    :return: ProcessPoolExecutor or None
+    """
+    import multiprocessing
+
+    if not parse_workers:
+        return None
+    return ProcessPoolExecutor(max_workers=parse_workers,
+                               mp_context=multiprocessing.get_context("spawn"))
+
+def collect_devices(devices, sink, max_workers=DEFAULT_WORKERS, site_limit=None,
+                    timeout=DEFAULT_TIMEOUT, cache=None, offline=False, parse_executor=None):
+    """
+    Collect every device on a bounded pool of threads. At most max_workers
+    devices are collected at the same time, and at most site_limit devices
+    from the same site. The threads only run the commands: their raw
+    outputs are parsed on parse_executor, so the Genie parsers run on every
+    core while the threads keep waiting on the devices. Without a
+    parse_executor the threads parse the outputs themselves. The tables of
+    every device are handed to the sink as soon as they are parsed, so no
+    device is kept after it is written.
+    """
+    # interleave the devices of each site so that the workers are not all
+    # waiting on the limit of the same site
+    sites = {}
+    for device in devices:
+        sites.setdefault(device_site(devices[device]), []).append(device)
+    site_locks = {}
+    for site in sites:
+        if site_limit:
+            site_locks[site] = threading.BoundedSemaphore(site_limit)
+    order = [device for group in zip_longest(*sites.values()) for device in group
+             if device is not None]
+
+    def run_device(device):
+        node = devices[device]
+        commands = platform_commands(node.os)
+        with site_locks.get(device_site(node)) or nullcontext():
+            outputs = fetch_outputs(device, node, commands, timeout, cache, offline)
+        if parse_executor:
+            return outputs
+        return parse_outputs(device_details(device, node), node, commands, outputs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(run_device, device): (device, "collect") for device in order}
+        while pending:
+            done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                device, stage = pending.pop(future)
+                node = devices[device]
+                try:
+                    if stage == "parse":
+                        device_tables = parse_result(future)
+                    elif parse_executor:
+                        pending[parse_executor.submit(parse_in_process,
+                                                      device_details(device, node), node.os,
+                                                      None, future.result())] = (device, "parse")
+                        continue
+                    else:
+                        device_tables = future.result()
+                except Exception as e:
+                    print(f"There was an issue collecting {device}")
+                    print(e)
+                    profiler.error(stage, device, None, e)
+                    continue
+                label = PLATFORMS[node.os]["label"]
+                for table, device_table in device_tables.items():
+                    with profiler.timed("write", device, table):
+                        sink.write(label, table, device_table)
+
+class ExcelSink:
+    """
+    Write the tables to an Excel file as the devices finish, with a sheet
+    for each platform label and table. The workbook is opened in the
+    constant memory mode of xlsxwriter, so every row is flushed to disk once
+    the next one is written. The cells of the interfaces sheets that
+    represent shutdown interfaces are highlighted in red.
+    """
+
+    def __init__(self, path, labels):
+        import xlsxwriter
+
+        self.workbook = xlsxwriter.Workbook(path, {"constant_memory": True,
+                                                   "nan_inf_to_errors": True})
+        self.header_format = self.workbook.add_format({"bold": True, "border": 1,
+                                                       "align": "center", "valign": "top"})
+        self.error_format = self.workbook.add_format({"bg_color": "red"})
+        # the worksheet, columns and number of rows of every sheet
+        self.sheets = {}
+        for label in labels:
+            for table, title in TABLES.items():
+                worksheet = self.workbook.add_worksheet(f"{label} {title}")
+                self.sheets[(label, table)] = [worksheet, None, 0]
+
+    def write(self, label, table, rows):
+        """
+        Append the rows of a Table to the sheet of the platform label and
+        table, starting the sheet with its header.
+        """
+        sheet = self.sheets[(label, table)]
+        worksheet = sheet[0]
+        if sheet[1] is None:
+            sheet[1] = ["device", "ip"] + rows.columns
+            worksheet.write_row(0, 1, sheet[1], self.header_format)
+        for record in rows.records():
+            worksheet.write(sheet[2] + 1, 0, sheet[2], self.header_format)
+            worksheet.write_row(sheet[2] + 1, 1, record)
+            sheet[2] += 1
+
+    def write_report(self, table, title, frame):
+        """
+        Add a sheet with a report computed from the tables. The values that
+        could not be computed, such as the utilization of an interface
+        without a bandwidth, are written as "n/a" like in the other sheets.
+        """
+        import numpy as np
+
+        frame = frame.replace([np.inf, -np.inf], np.nan).astype(object)
+        frame = frame.where(frame.notna(), "n/a")
+        worksheet = self.workbook.add_worksheet(title)
+        worksheet.write_row(0, 0, list(frame.columns), self.header_format)
+        for index, record in enumerate(frame.itertuples(index=False)):
+            worksheet.write_row(index + 1, 0, record)
+
+    def close(self):
+        """
+        Highlight the interfaces that are not enabled and finish the file.
+        """
+        from xlsxwriter.utility import xl_col_to_name
+
+        for (label, table), (worksheet, columns, count) in self.sheets.items():
+            if table == "interfaces" and columns:
+                enabled_col = xl_col_to_name(columns.index("enabled") + 1)
+                worksheet.conditional_format(f"{enabled_col}1:{enabled_col}{count + 1}",
+                                             {"type": "text",
+                                              "criteria": "containing",
+                                              "value": "FALSE",
+                                              "format": self.error_format})
+        self.workbook.close()
+
+class CsvSink:
+    """
+    Write the tables to gzip compressed CSV files as the devices finish,
+    with a file for each platform label and table in the output directory.
+    """
+
+    def __init__(self, path, labels):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        # the open file and csv writer of every file
+        self.files = {}
+
+    def write(self, label, table, rows):
+        """
+        Append the rows of a Table to the file of the platform label and
+        table, starting the file with its header.
+        """
+        if (label, table) not in self.files:
+            csv_file = gzip.open(os.path.join(self.path, f"{label}_{table}.csv.gz"), "wt",
+                                 newline="")
+            writer = csv.writer(csv_file)
+            writer.writerow(["device", "ip"] + rows.columns)
+            self.files[(label, table)] = (csv_file, writer)
+        self.files[(label, table)][1].writerows(rows.records())
+
+    def write_report(self, table, title, frame):
+        frame.to_csv(os.path.join(self.path, f"{table}.csv.gz"), index=False)
+
+    def close(self):
+        for csv_file, writer in self.files.values():
+            csv_file.close()
+
+
+class ColumnarSink:
+    """
+    Collect the tables of every platform label and write each of them as a
+    single columnar file when the sink is closed. The file format is
+    decided by write_frame in the subclasses.
+    """
+
+    def __init__(self, path, labels):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.tables = {}
+
+    def write(self, label, table, rows):
+        if (label, table) in self.tables:
+            self.tables[(label, table)].extend(rows)
         else:
-            memory_processes = {}
-        if show_ospf_neighbor:
-            ospf_neighbors = show_ospf_neighbor["vrf"]
+            self.tables[(label, table)] = rows
+
+    def write_report(self, table, title, frame):
+        self.write_frame(REPORT_LABEL, table, arrow_frame(frame))
+
+    def close(self):
+        for (label, table), rows in self.tables.items():
+            self.write_frame(label, table, arrow_frame(rows.to_frame(), table))
+        self.tables = {}
+
+
+class ParquetSink(ColumnarSink):
+    """
+    Write the tables to Parquet files partitioned by the date of the run and
+    the platform label, as <table>/run_date=<date>/os=<label>/<time>.parquet.
+    """
+
+    def __init__(self, path, labels):
+        super().__init__(path, labels)
+        self.run_time = datetime.now()
+
+    def write_frame(self, label, table, frame):
+        partition = os.path.join(self.path, table, f"run_date={self.run_time:%Y-%m-%d}",
+                                 f"os={label}")
+        os.makedirs(partition, exist_ok=True)
+        frame.to_parquet(os.path.join(partition, f"{self.run_time:%H%M%S}.parquet"),
+                         index=False)
+
+
+class ArrowSink(ColumnarSink):
+    """
+    Write the tables to Arrow IPC files, with a file for each platform label
+    and table, which can be memory mapped by the readers.
+    """
+
+    def write_frame(self, label, table, frame):
+        frame.to_feather(os.path.join(self.path, f"{label}_{table}.arrow"),
+                         compression="uncompressed")
+
+
+# the type of every column of the tables in the columnar files, so that
+# the files of every run and platform share one schema whatever their rows
+# hold; the columns that can be "n/a" are always text
+TABLE_TYPES = {
+    "interfaces": {"device": "string", "ip": "string", "interface": "string",
+                   "enabled": "boolean", "oper_status": "string", "admin_state": "string",
+                   "auto_negotiate": "string", "bandwidth": "string", "mtu": "string",
+                   "port_mode": "string", "out_rate": "string", "in_rate": "string"},
+    "cpu_processes": {"device": "string", "ip": "string", "invoked": "Int64", "p_id": "Int64",
+                      "process": "string", "runtime": "Int64", "usecs": "Int64"},
+    "memory_processes": {"device": "string", "ip": "string", "p_id": "Int64",
+                         "process": "string", "tty": "Int64", "allocated": "Int64",
+                         "freed": "Int64", "holding": "Int64", "getbufs": "Int64",
+                         "retbufs": "Int64", "used": "Int64"},
+    "ospf_neighbors": {column: "string" for column in ["device", "ip"] + OSPF_NEIGHBOR_COLUMNS}
+}
+
+def arrow_frame(frame, table=None):
+    """
+    Prepare a DataFrame for Arrow, since Arrow needs a single type for
+    every column. The tables get every column and type of TABLE_TYPES, with
+    the columns of the other platforms left empty, and the columns added to
+    them such as the change of the delta mode are kept in front as text. In
+    the reports, the object columns that mix numbers with strings such as
+    "n/a" are turned into string columns.
+    :return: DataFrame that can be written to Arrow
+    """
+    import pandas as pd
+
+    if table in TABLE_TYPES:
+        extra = [column for column in frame.columns if column not in TABLE_TYPES[table]]
+        types = {**dict.fromkeys(extra, "string"), **TABLE_TYPES[table]}
+        frame = frame.reindex(columns=list(types))
+        for column, dtype in types.items():
+            if dtype == "string":
+                frame[column] = frame[column].astype(object).map(
+                    lambda value: None if pd.isna(value) else str(value)).astype("string")
+            elif dtype == "Int64":
+                frame[column] = pd.to_numeric(frame[column], errors="coerce").astype("Int64")
+            else:
+                frame[column] = frame[column].astype(dtype)
+        return frame
+
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            types = {type(value) for value in frame[column] if value is not None}
+            if len(types) > 1:
+                frame[column] = frame[column].map(lambda value: None if value is None else str(value))
+    return frame
+
+# the columns that identify a row of each table on a device when the rows
+# are compared with the previous run
+DIFF_KEYS = {
+    "interfaces": ["interface"],
+    "cpu_processes": ["p_id", "process"],
+    "memory_processes": ["p_id", "process"],
+    "ospf_neighbors": ["vrf", "process_id", "area", "interface", "neighbor"]
+}
+
+# the columns of each table that change on every run, which are not
+# compared so that only real changes are reported
+DIFF_IGNORE = {
+    "interfaces": ["out_rate", "in_rate"],
+    "cpu_processes": ["invoked", "runtime", "usecs"],
+    "memory_processes": ["allocated", "freed", "holding", "getbufs", "retbufs", "used"],
+    "ospf_neighbors": ["dead_time"]
+}
+
+
+class SnapshotStore:
+    """
+    The rows last seen on every device, kept in a JSON file between runs.
+    The rows are stored by platform label and table, then by device, then by
+    the values of the DIFF_KEYS columns of the table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as snapshot_file:
+                self.snapshot = json.load(snapshot_file)
         else:
-            ospf_neighbors = {}
-
-        if show_interface:
-            nxos_info["interfaces"].extend(parse_interfaces(show_interface, device_info))
-        if cpu_processes:
-            nxos_info["cpu_processes"].extend(parse_cpu_process(cpu_processes, device_info))
-        if memory_processes:
-            nxos_info["memory_processes"].extend(parse_nx_memory_process(memory_processes, device_info))
-        if ospf_neighbors:
-            nxos_info["ospf_neighbors"].extend(parse_ospf_neighbor(ospf_neighbors, device_info))
-
-    return nxos_info
-
-def run_ios_commands(ios_devices):
-    """
-    Connect to IOS devices and run the commands show interfaces, 
-    show ip ospf neighbor, show processes memory, and show 
-    processes cpu. Add the results of running the commands to a 
-    dictionary.
-    :return: dictionary containing lists with the parsed results of 
-    running the commands on each device
-    """
-    ios_info = {
-        "interfaces": [],
-        "cpu_processes": [],
-        "memory_processes": [],
-        "ospf_neighbors": []
-    }
-    for device in ios_devices:
-        node = ios_devices[device]
-        ip_addr = node.connections["cli"]["ip"]
-        device_info = {"name": device, "ip": ip_addr}
-        node.connect(init_exec_commands=[], init_config_commands=[],
-                       log_stdout=False, learn_hostname=True)
+            self.snapshot = {}
+
+    def diff(self, label, table, rows):
+        """
+        Compare the rows of a Table with the rows last seen on the same
+        devices, leaving out the DIFF_IGNORE columns, and remember the new
+        rows.
+        :return: Table with the rows that were added, removed or changed,
+        and a change column saying which
+        """
+        changes = Table(["change"] + rows.columns)
+        key_positions = [rows.columns.index(column) for column in DIFF_KEYS[table]]
+        compare_positions = [position for position, column in enumerate(rows.columns)
+                             if column not in DIFF_IGNORE[table]]
+        snapshot = self.snapshot.setdefault(f"{label} {table}", {})
+        records = rows.records()
+        for name, ip, count in rows.devices:
+            previous = snapshot.get(name, {})
+            current = {}
+            changed = 0
+            for index in range(count):
+                values = next(records)[2:]
+                key = json.dumps([values[position] for position in key_positions])
+                current[key] = values
+                if key not in previous:
+                    changes.append(["added"] + values)
+                    changed += 1
+                elif any(previous[key][position] != values[position]
+                         for position in compare_positions):
+                    changes.append(["changed"] + values)
+                    changed += 1
+            for key, values in previous.items():
+                if key not in current:
+                    changes.append(["removed"] + values)
+                    changed += 1
+            changes.add_device({"name": name, "ip": ip}, changed)
+            snapshot[name] = current
+        return changes
+
+    def save(self):
+        with open(f"{self.path}.tmp", "w") as snapshot_file:
+            json.dump(self.snapshot, snapshot_file)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+class DeltaSink:
+    """
+    Pass only the rows that changed since the previous run on to another
+    sink, see SnapshotStore.diff.
+    """
+
+    def __init__(self, sink, store):
+        self.sink = sink
+        self.store = store
+
+    def write(self, label, table, rows):
+        changes = self.store.diff(label, table, rows)
+        if len(changes):
+            self.sink.write(label, table, changes)
+
+    def write_report(self, table, title, frame):
+        self.sink.write_report(table, title, frame)
+
+    def close(self):
+        self.sink.close()
+        self.store.save()
+
+class SeriesStore:
+    """
+    A history of rows kept on disk as compressed NumPy files, with a typed
+    array for each column: the device name and text columns as strings, the
+    number columns as floats with NaN for missing values, and the time each
+    row was recorded. Every save adds a file, and once there are more than
+    max_chunks files the oldest half is merged into one, leaving out the
+    rows older than max_age seconds.
+    """
+
+    def __init__(self, path, text_columns, number_columns, max_age=DEFAULT_HISTORY_AGE,
+                 max_chunks=DEFAULT_HISTORY_CHUNKS):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.text_columns = text_columns
+        self.number_columns = number_columns
+        self.max_age = max_age
+        self.max_chunks = max_chunks
+        self.pending = []
+
+    def append(self, rows):
+        """
+        Add the rows of a Table, recorded at the current time, to the next
+        save.
+        """
+        self.pending.append((time.time(), rows))
+
+    def chunks(self):
+        """
+        Find the files of the history.
+        :return: list of tuples with the time of the first and last rows of
+        each file and its path, oldest first
+        """
+        chunks = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".npz"):
+                first, last = entry.name.split("-")[:2]
+                chunks.append((float(first), float(last), entry.path))
+        return sorted(chunks)
+
+    def write_chunk(self, arrays):
+        import numpy as np
+
+        timestamps = arrays["timestamp"]
+        path = os.path.join(self.path, f"{timestamps.min():.0f}-{timestamps.max():.0f}-"
+                                       f"{time.time_ns()}.npz")
+        np.savez_compressed(f"{path}.tmp.npz", **arrays)
+        os.replace(f"{path}.tmp.npz", path)
+
+    def save(self):
+        """
+        Write the rows added since the last save to a new file.
+        """
+        import numpy as np
+        import pandas as pd
+
+        if not self.pending:
+            return
+        arrays = {"timestamp": [], "device": []}
+        for column in self.text_columns + self.number_columns:
+            arrays[column] = []
+        for timestamp, rows in self.pending:
+            counts = [count for name, ip, count in rows.devices]
+            arrays["timestamp"].append(np.full(len(rows), timestamp))
+            arrays["device"].append(np.repeat(np.array([name for name, ip, count in rows.devices],
+                                                       dtype=str), counts))
+            for column in self.text_columns:
+                arrays[column].append(np.array(rows.data[rows.columns.index(column)], dtype=str))
+            for column in self.number_columns:
+                values = rows.data[rows.columns.index(column)]
+                arrays[column].append(pd.to_numeric(pd.Series(values, dtype=object),
+                                                    errors="coerce").to_numpy(float))
+        self.pending = []
+        arrays = {column: np.concatenate(values) for column, values in arrays.items()}
+        # the devices that had no rows add nothing to the history
+        if len(arrays["timestamp"]):
+            self.write_chunk(arrays)
+
+        chunks = self.chunks()
+        if len(chunks) > self.max_chunks:
+            oldest = chunks[:len(chunks) // 2]
+            merged = self.read([path for first, last, path in oldest])
+            merged = {column: values[merged["timestamp"] >= time.time() - self.max_age]
+                      for column, values in merged.items()}
+            if len(merged["timestamp"]):
+                self.write_chunk(merged)
+            for first, last, path in oldest:
+                os.remove(path)
+
+    def read(self, paths):
+        import numpy as np
+
+        arrays = {}
+        for path in paths:
+            with np.load(path) as chunk:
+                for column in chunk.files:
+                    arrays.setdefault(column, []).append(chunk[column])
+        return {column: np.concatenate(values) for column, values in arrays.items()}
+
+    def load(self, since=0):
+        """
+        Read the rows recorded since a time, skipping the files that only
+        have older rows.
+        :return: DataFrame with the rows, the device name and text columns
+        as categorical columns
+        """
+        import pandas as pd
+
+        columns = ["timestamp", "device"] + self.text_columns + self.number_columns
+        paths = [path for first, last, path in self.chunks() if last >= since]
+        if not paths:
+            return pd.DataFrame(columns=columns)
+        arrays = self.read(paths)
+        keep = arrays["timestamp"] >= since
+        frame = pd.DataFrame({column: arrays[column][keep] for column in columns})
+        for column in ["device"] + self.text_columns:
+            frame[column] = frame[column].astype("category")
+        return frame
+
+
+def interface_utilization(history, window=DEFAULT_WINDOW, top=DEFAULT_TOP):
+    """
+    Compute the utilization of every interface from the samples of the
+    interface history in the last window seconds. The utilization is the
+    higher of the input and output rates as a percent of the bandwidth. For
+    every interface the latest utilization, the 95th percentile over the
+    window and the errors counted during the window are computed with
+    grouped operations over the whole fleet at once.
+    :return: list of tuples with the table, title and DataFrame of the
+    utilization of every interface, the busiest interfaces, and the
+    interfaces with the most errors
+    """
+    import numpy as np
+    import pandas as pd
+
+    frame = history.load(time.time() - window)
+    if frame.empty:
+        return []
+    frame = frame.sort_values("timestamp", kind="stable")
+    bandwidth = frame["bandwidth"].where(frame["bandwidth"] > 0) * 1000
+    frame["utilization"] = np.fmax(frame["in_rate"], frame["out_rate"]) / bandwidth * 100
+    frame["errors"] = frame["in_errors"] + frame["out_errors"]
+
+    groups = frame.groupby(["device", "interface"], observed=True, sort=False)
+    utilization = groups["utilization"]
+    errors = groups["errors"]
+    summary = pd.DataFrame({
+        "samples": utilization.size(),
+        "bandwidth": groups["bandwidth"].last(),
+        "utilization": utilization.last(),
+        "p95_utilization": utilization.quantile(0.95),
+        # a counter that went down was cleared, so only the growth is counted
+        "errors": (errors.last() - errors.first()).clip(lower=0)
+    }).reset_index()
+
+    busiest = summary.nlargest(top, "p95_utilization")
+    error_prone = summary[summary["errors"] > 0].nlargest(top, "errors")
+    return [("interface_utilization", "Interface Utilization", summary),
+            ("busiest_interfaces", "Busiest Interfaces", busiest),
+            ("interface_errors", "Interface Errors", error_prone)]
+
+def memory_leaks(history, window=DEFAULT_LEAK_WINDOW, samples=DEFAULT_LEAK_SAMPLES,
+                 top=DEFAULT_TOP):
+    """
+    Find the processes whose memory keeps growing, from the latest samples
+    of the memory history in the last window seconds. Every process is a
+    series of its own for each device, process id and process name, so a
+    process id reused by another process starts a new series. A process is
+    a suspect when its memory never went down over its latest samples and
+    grew overall, and the suspects are ranked by the least squares slope of
+    their memory over time. Only the processes that were in the latest
+    collection of their device are ranked, so a process that exited, or
+    whose id was taken over, is not reported from its old samples. The sums
+    the slope is computed from are grouped operations over every process of
+    the fleet at once.
+    :return: list with a tuple with the table, title and DataFrame of the
+    suspects
+    """
+    import numpy as np
+    import pandas as pd
+
+    frame = history.load(time.time() - window).dropna(subset=["memory"])
+    if frame.empty:
+        return []
+    # number every process once and sort the samples by process and time,
+    # so the rest is done on flat arrays with the samples of each process
+    # next to each other
+    keys = ["device", "p_id", "process"]
+    codes = frame.groupby(keys, observed=True, sort=False).ngroup().to_numpy()
+    processes = frame[keys].iloc[np.unique(codes, return_index=True)[1]].reset_index(drop=True)
+    timestamps = frame["timestamp"].to_numpy()
+    order = np.lexsort((timestamps, codes))
+    codes = codes[order]
+    timestamps = timestamps[order]
+    # processes with the same id and name on a device, like the dead
+    # processes of IOS, are added up
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1])
+                                  | (timestamps[1:] != timestamps[:-1])])
+    memory = np.add.reduceat(frame["memory"].to_numpy()[order], starts)
+    codes = codes[starts]
+    timestamps = timestamps[starts]
+
+    # keep the latest samples of each process
+    count = np.bincount(codes, minlength=len(processes))
+    first_index = np.r_[0, np.cumsum(count)[:-1]]
+    keep = np.arange(len(codes)) - first_index[codes] >= count[codes] - samples
+    codes = codes[keep]
+    timestamps = timestamps[keep]
+    memory = memory[keep]
+    count = np.bincount(codes, minlength=len(processes))
+    first_index = np.r_[0, np.cumsum(count)[:-1]]
+    last_index = first_index + count - 1
+
+    # the processes whose latest sample is from the latest collection of
+    # their device are still running
+    devices = processes["device"].cat.codes.to_numpy()
+    latest = np.full(len(processes["device"].cat.categories), -np.inf)
+    np.maximum.at(latest, devices, timestamps[last_index])
+    running = timestamps[last_index] == latest[devices]
+
+    hours = (timestamps - timestamps[first_index][codes]) / 3600
+    sum_hours = np.bincount(codes, hours, len(processes))
+    sum_memory = np.bincount(codes, memory, len(processes))
+    sum_hours_memory = np.bincount(codes, hours * memory, len(processes))
+    sum_hours_squared = np.bincount(codes, hours * hours, len(processes))
+    variance = count * sum_hours_squared - sum_hours ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(variance > 0,
+                         (count * sum_hours_memory - sum_hours * sum_memory) / variance, np.nan)
+        first = memory[first_index]
+        last = memory[last_index]
+        growth_percent = np.where(first > 0, (last - first) / first * 100, np.nan)
+    drops = np.bincount(codes[1:], (memory[1:] < memory[:-1]) & (codes[1:] == codes[:-1]),
+                        len(processes))
+
+    summary = processes.assign(samples=count, first=first, last=last, growth=last - first,
+                               growth_percent=growth_percent, slope_per_hour=slope)
+    suspects = summary[running & (count >= MIN_LEAK_SAMPLES) & (drops == 0) & (last > first)
+                       & np.isfinite(slope)]
+    suspects = suspects.nlargest(top, "slope_per_hour").reset_index(drop=True)
+    return [("memory_leaks", "Memory Leak Suspects", suspects)]
+
+
+class HistorySink:
+    """
+    Keep the rows of the history tables in their SeriesStore and pass the
+    tables of the report on to another sink. When the sink is closed the
+    histories are saved and the reports computed from them are added to the
+    other sink.
+    """
+
+    def __init__(self, sink, histories, reports):
+        self.sink = sink
+        self.histories = histories
+        self.reports = reports
+
+    def write(self, label, table, rows):
+        if table in self.histories:
+            self.histories[table].append(rows)
+        if table in TABLES:
+            self.sink.write(label, table, rows)
+
+    def write_report(self, table, title, frame):
+        self.sink.write_report(table, title, frame)
+
+    def close(self):
         try:
-            show_interface = node.parse("show interfaces")
-        except Exception as e:
-            print(f"There was an issue getting the interfaces for {device}")
-            print(e)
-            show_interface = {}
+            for history in self.histories.values():
+                history.save()
+            for report in self.reports:
+                for table, title, frame in report():
+                    self.sink.write_report(table, title, frame)
+        finally:
+            self.sink.close()
+
+class OspfGraph:
+    """
+    The OSPF adjacencies of the whole fleet, built from the OSPF neighbor
+    rows of every device. Each neighbor is matched to the device it runs on
+    by its address, looked up in the interface addresses of every device,
+    or else by its router id once another neighbor with that router id was
+    matched. Neighbors that match no device stay in the graph under their
+    router id. The devices, router ids and interface addresses are indexed
+    in dictionaries, so the graph is built and queried in time linear in
+    the number of neighbors.
+    """
+
+    def __init__(self, neighbors, addresses):
+        self.by_address = {}
+        self.by_device = {}
+        self.by_router_id = {}
+        self.peers = {}
+        self.links = {}
+        self.adjacencies = []
+        for address in addresses.rows():
+            self.by_address[address["address"]] = address
+
+        rows = list(neighbors.rows())
+        for row in rows:
+            if row["address"] in self.by_address:
+                self.by_router_id.setdefault(row["router_id"],
+                                             self.by_address[row["address"]]["device"])
+        for row in rows:
+            if row["address"] in self.by_address:
+                row["peer_device"] = self.by_address[row["address"]]["device"]
+            else:
+                row["peer_device"] = self.by_router_id.get(row["router_id"])
+            row["peer"] = row["peer_device"] or row["router_id"]
+            self.by_device.setdefault(row["device"], []).append(row)
+            self.peers.setdefault(row["device"], set()).add(row["peer"])
+            self.adjacencies.append(row)
+            self.links.setdefault(row["device"], set()).add(row["peer"])
+            self.links.setdefault(row["peer"], set()).add(row["device"])
+        self.router_ids = {device: router_id for router_id, device in self.by_router_id.items()}
+
+    def one_sided(self):
+        """
+        Find the adjacencies of a device with another device of the fleet
+        that does not list the first device among its own neighbors.
+        :return: list of the neighbor rows
+        """
+        return [row for row in self.adjacencies if row["peer_device"]
+                and row["device"] not in self.peers.get(row["peer_device"], ())]
+
+    def not_full(self):
+        """
+        Find the neighbors that are not in the FULL state.
+        :return: list of the neighbor rows
+        """
+        return [row for row in self.adjacencies
+                if not str(row["state"]).lower().startswith("full")]
+
+    def cut_routers(self):
+        """
+        Find the routers whose loss would split the OSPF domain in two, as the
+        articulation points of the graph, with an iterative version of
+        Tarjan's algorithm.
+        :return: set of the devices, or router ids for the routers outside
+        the fleet
+        """
+        order = {}
+        low = {}
+        points = set()
+        for root in self.links:
+            if root in order:
+                continue
+            order[root] = low[root] = len(order)
+            children = 0
+            stack = [(root, None, iter(self.links[root]))]
+            while stack:
+                node, parent, peers = stack[-1]
+                for peer in peers:
+                    if peer == parent:
+                        continue
+                    if peer in order:
+                        low[node] = min(low[node], order[peer])
+                    else:
+                        order[peer] = low[peer] = len(order)
+                        stack.append((peer, node, iter(self.links[peer])))
+                        break
+                else:
+                    stack.pop()
+                    if parent == root:
+                        children += 1
+                    elif parent is not None:
+                        low[parent] = min(low[parent], low[node])
+                        if low[node] >= order[parent]:
+                            points.add(parent)
+            if children > 1:
+                points.add(root)
+        return points
+
+    def area_counts(self):
+        """
+        Count the neighbors of every device in each of its areas.
+        :return: Counter of the neighbors and Counter of the FULL neighbors,
+        keyed by (device, area)
+        """
+        neighbors = Counter()
+        full = Counter()
+        for row in self.adjacencies:
+            neighbors[(row["device"], row["area"])] += 1
+            if str(row["state"]).lower().startswith("full"):
+                full[(row["device"], row["area"])] += 1
+        return neighbors, full
+
+    def topology(self):
+        """
+        Describe the graph as nodes and links for the dashboard.
+        :return: dictionary with the list of nodes and the list of links
+        """
+        return {
+            "nodes": [{"id": node, "collected": node in self.by_device,
+                       "router_id": self.router_ids.get(node, node)}
+                      for node in self.links],
+            "links": [{"source": row["device"], "target": row["peer"], "vrf": row["vrf"],
+                       "area": row["area"], "interface": row["interface"],
+                       "address": row["address"], "state": row["state"]}
+                      for row in self.adjacencies]
+        }
+
+
+def ospf_reports(graph):
+    """
+    Check the OSPF graph of the fleet for one-sided adjacencies, neighbors
+    that are not FULL and routers that would split the domain, and count
+    the neighbors of every area.
+    :return: list of tuples with the table, title and DataFrame of each
+    report
+    """
+    import pandas as pd
+
+    if not graph.adjacencies:
+        return []
+    columns = ["device", "vrf", "process_id", "area", "interface", "router_id", "address",
+               "state", "peer"]
+    one_sided = pd.DataFrame(graph.one_sided(), columns=columns)
+    not_full = pd.DataFrame(graph.not_full(), columns=columns)
+    cut_routers = pd.DataFrame([(node, graph.router_ids.get(node, node), len(graph.links[node]))
+                                for node in sorted(graph.cut_routers())],
+                               columns=["router", "router_id", "neighbors"])
+    neighbors, full = graph.area_counts()
+    areas = pd.DataFrame([(device, area, count, full[(device, area)])
+                          for (device, area), count in neighbors.items()],
+                         columns=["device", "area", "neighbors", "full"])
+    return [("ospf_one_sided", "OSPF One-Sided Adjacencies", one_sided),
+            ("ospf_not_full", "OSPF Neighbors Not Full", not_full),
+            ("ospf_cut_routers", "OSPF Cut Routers", cut_routers),
+            ("ospf_areas", "OSPF Areas", areas)]
+
+
+class LatestRows:
+    """
+    The latest rows of every device in some of the tables, kept for the
+    whole run. In daemon mode a new sink is created on every flush, and
+    only some devices are polled before each of them, so the OSPF graph is
+    built from the latest rows of every device instead of the rows written
+    to the sink.
+    """
+
+    def __init__(self, tables):
+        self.columns = tables
+        self.tables = {table: {} for table in tables}
+
+    def update(self, table, rows):
+        """
+        Replace the rows of the devices of a Table, including the devices
+        that have no rows anymore.
+        """
+        position = 0
+        for name, ip, count in rows.devices:
+            device_rows = Table(rows.columns)
+            device_rows.data = [values[position:position + count] for values in rows.data]
+            device_rows.devices = [(name, ip, count)]
+            self.tables[table][name] = device_rows
+            position += count
+
+    def table(self, table):
+        """
+        :return: Table with the latest rows of every device
+        """
+        rows = Table(self.columns[table])
+        for device_rows in self.tables[table].values():
+            rows.extend(device_rows)
+        return rows
+
+
+class TopologySink:
+    """
+    Keep the latest OSPF neighbors and interface addresses of every device
+    in latest and pass every table on to another sink. When the sink is
+    closed the OSPF graph is built from the latest rows, its reports are
+    added to the other sink, and the topology is written as JSON to path if
+    there is one.
+    """
+
+    def __init__(self, sink, latest, path=None):
+        self.sink = sink
+        self.latest = latest
+        self.path = path
+
+    def write(self, label, table, rows):
+        if table in self.latest.tables:
+            self.latest.update(table, rows)
+        self.sink.write(label, table, rows)
+
+    def write_report(self, table, title, frame):
+        self.sink.write_report(table, title, frame)
+
+    def close(self):
         try:
-            show_ospf_neighbor = node.parse("show ip ospf neighbor")
+            with profiler.timed("graph", None, "ospf"):
+                graph = OspfGraph(self.latest.table("ospf_neighbors"),
+                                  self.latest.table("interface_addresses"))
+                reports = ospf_reports(graph)
+            for table, title, frame in reports:
+                self.sink.write_report(table, title, frame)
+            if self.path:
+                with open(self.path, "w") as topology_file:
+                    json.dump(graph.topology(), topology_file, default=str)
+        finally:
+            self.sink.close()
+
+# the formats the tables can be written in, and the default path they are
+# written to
+OUTPUT_FORMATS = {
+    "xlsx": {"sink": ExcelSink, "path": "network_analytics.xlsx"},
+    "parquet": {"sink": ParquetSink, "path": "network_analytics"},
+    "arrow": {"sink": ArrowSink, "path": "network_analytics"},
+    "csv": {"sink": CsvSink, "path": "network_analytics"}
+}
+
+def poll_devices(devices, create_sink, intervals, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_workers=DEFAULT_WORKERS, site_limit=None, timeout=DEFAULT_TIMEOUT,
+                 cache=None, parse_executor=None):
+    """
+    Keep polling the devices until the script is interrupted, running the
+    command of each table on its own interval in seconds. The first poll of
+    every device and table is spread randomly over its interval so the
+    devices are not all polled at once, and the sessions stay open between
+    polls. A device runs one poll at a time: tables that come due while the
+    device is busy, or while all workers are busy, wait for it and are run
+    together, and a table that is already waiting is not added again. A new
+    sink is created every flush_interval seconds and the previous one is
+    closed, so the results are written out as the daemon runs. As in
+    collect_devices, the outputs are parsed on parse_executor when there is
+    one, and the device can be polled again while they are parsed. When the
+    daemon stops, the polls that are running are finished, the devices are
+    disconnected and the outputs still being parsed are written to the last
+    sink before it is closed.
+    """
+    results = queue.Queue()
+    schedule = []
+    now = time.monotonic()
+    for device in devices:
+        node = devices[device]
+        for spec in PLATFORMS[node.os]["commands"]:
+            if spec["table"] in intervals:
+                due = now + random.uniform(0, intervals[spec["table"]])
+                heapq.heappush(schedule, (due, device, spec["table"]))
+    busy = set()
+    busy_sites = {}
+    waiting = {}
+    sink = create_sink()
+    flush_time = now + flush_interval
+    # the number of outputs being parsed
+    parsing = 0
+
+    def parsed(device, future):
+        device_tables = None
+        try:
+            device_tables = parse_result(future)
         except Exception as e:
-            print(f"There was an issue getting the ospf neighbor information for {device}")
+            print(f"There was an issue parsing the outputs of {device}")
             print(e)
-            show_ospf_neighbor = {}
+            profiler.error("parse", device, None, e)
+        results.put(("parsed", device, device_tables))
+
+    def run_poll(device, tables):
+        node = devices[device]
+        commands = platform_commands(node.os, tables)
         try:
-            show_memory = node.parse("show processes memory")
+            outputs = poll_outputs(device, node, commands, timeout, cache)
         except Exception as e:
-            print(f"There was an issue getting the memory information for {device}")
+            print(f"There was an issue polling {device}")
             print(e)
-            show_memory = {}
+            profiler.error("collect", device, None, e)
+            outputs = []
+        results.put(("polled", device, None))
+        if not outputs:
+            return
+        # every output that is parsed is followed by a parsed result, even
+        # when it cannot be parsed
+        results.put(("parsing", device, None))
+        if parse_executor:
+            future = parse_executor.submit(parse_in_process, device_details(device, node),
+                                           node.os, tables, outputs)
+            future.add_done_callback(partial(parsed, device))
+            return
         try:
-            show_cpu = node.parse("show processes cpu")
+            device_tables = parse_outputs(device_details(device, node), node, commands, outputs)
         except Exception as e:
-            print(f"There was an issue getting the cpu processes for {device}")
+            print(f"There was an issue parsing the outputs of {device}")
             print(e)
-            show_cpu = {}
-        node.disconnect()
+            profiler.error("parse", device, None, e)
+            device_tables = None
+        results.put(("parsed", device, device_tables))
 
-        if show_cpu:
-            cpu_processes = show_cpu["index"]
-        else:
-            cpu_processes = {}
-        if show_memory:
-            memory_processes = show_memory["pid"]
-        else:
-            memory_processes = {}
-        if show_ospf_neighbor:
-            ospf_neighbors = show_ospf_neighbor["vrf"]
-        else:
-            ospf_neighbors = {}
+    def write_tables(device, device_tables):
+        label = PLATFORMS[devices[device].os]["label"]
+        for table, device_table in device_tables.items():
+            with profiler.timed("write", device, table):
+                sink.write(label, table, device_table)
+
+    def start_waiting_polls(executor):
+        for device in list(waiting):
+            site = device_site(devices[device])
+            if len(busy) >= max_workers:
+                break
+            if device in busy or (site_limit and busy_sites.get(site, 0) >= site_limit):
+                continue
+            busy.add(device)
+            busy_sites[site] = busy_sites.get(site, 0) + 1
+            executor.submit(run_poll, device, list(waiting.pop(device)))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while schedule:
+            now = time.monotonic()
+            while schedule[0][0] <= now:
+                due, device, table = heapq.heappop(schedule)
+                # skip the polls that were missed while the device was busy
+                interval = intervals[table]
+                due += interval * max(1, math.ceil((now - due) / interval))
+                heapq.heappush(schedule, (due, device, table))
+                waiting.setdefault(device, {})[table] = None
+            start_waiting_polls(executor)
+
+            try:
+                stage, device, device_tables = results.get(
+                    timeout=max(min(schedule[0][0], flush_time) - now, 0))
+            except queue.Empty:
+                stage = None
+            if stage == "polled":
+                busy.discard(device)
+                busy_sites[device_site(devices[device])] -= 1
+                start_waiting_polls(executor)
+            elif stage == "parsing":
+                parsing += 1
+            elif stage == "parsed":
+                parsing -= 1
+                if device_tables:
+                    write_tables(device, device_tables)
+
+            if time.monotonic() >= flush_time:
+                with profiler.timed("write", None, "close"):
+                    sink.close()
+                if cache:
+                    cache.save()
+                sink = create_sink()
+                flush_time = time.monotonic() + flush_interval
+    except KeyboardInterrupt:
+        print("Stopping the polling of the devices")
+    finally:
+        # let the polls that are running finish before their sessions are
+        # closed, and drop those that have not started
+        executor.shutdown(wait=True, cancel_futures=True)
+        for node in devices.values():
+            if node.is_connected():
+                node.disconnect()
+        # every poll has queued its outputs by now, so wait until those being
+        # parsed are written
+        while parsing or not results.empty():
+            stage, device, device_tables = results.get()
+            if stage == "parsing":
+                parsing += 1
+            elif stage == "parsed":
+                parsing -= 1
+                if device_tables:
+                    write_tables(device, device_tables)
+        sink.close()
+
+class WorkQueue:
+    """
+    The devices of a sharded collection and their results, kept in a SQLite
+    database that every worker process opens. Every device is given a shard
+    and a worker leases a device before collecting it, preferring the
+    devices of its own shard. When a lease runs out, because its worker
+    died or hung, another worker collects the device again, up to
+    max_attempts times.
+    """
+
+    def __init__(self, path, max_attempts=DEFAULT_SHARD_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        with self.connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS tasks (device TEXT PRIMARY KEY, "
+                               "shard INTEGER, state TEXT, owner TEXT, lease_until REAL, "
+                               "attempts INTEGER, error TEXT)")
+            connection.execute("CREATE TABLE IF NOT EXISTS results (device TEXT, label TEXT, "
+                               "table_name TEXT, rows TEXT)")
+
+    @contextmanager
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, devices, shards, shard_by="name"):
+        """
+        Replace the devices and results of the queue with the devices given,
+        split into shards by the hash of their name or of their site.
+        """
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM tasks")
+            connection.execute("DELETE FROM results")
+            for device, node in devices.items():
+                key = device if shard_by == "name" else device_site(node)
+                connection.execute("INSERT INTO tasks VALUES (?, ?, 'pending', NULL, 0, 0, NULL)",
+                                   (device, zlib.crc32(key.encode()) % shards))
+            connection.execute("COMMIT")
+
+    def claim(self, shard, owner, lease):
+        """
+        Lease the next device to collect for a worker, from its own shard
+        first and from the other shards once its own is done.
+        :return: name of the device, or None if no device can be leased
+        """
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("UPDATE tasks SET state = 'failed', error = 'the lease ran out' "
+                               "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                               (now, self.max_attempts))
+            row = connection.execute("SELECT device FROM tasks WHERE state = 'pending' OR "
+                                     "(state = 'leased' AND lease_until < ?) "
+                                     "ORDER BY shard != ?, shard LIMIT 1", (now, shard)).fetchone()
+            if row:
+                connection.execute("UPDATE tasks SET state = 'leased', owner = ?, lease_until = ?, "
+                                   "attempts = attempts + 1 WHERE device = ?",
+                                   (owner, now + lease, row[0]))
+            connection.execute("COMMIT")
+        return row[0] if row else None
+
+    def complete(self, device, owner, label, device_tables):
+        """
+        Save the tables of a device, unless its lease was given to another
+        worker in the meantime. The tables are saved as JSON, since the
+        queue can be shared with other hosts and is not trusted to hold
+        anything that runs code when it is read.
+        """
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT owner, state FROM tasks WHERE device = ?",
+                                     (device,)).fetchone()
+            if row == (owner, "leased"):
+                for table, rows in device_tables.items():
+                    connection.execute("INSERT INTO results VALUES (?, ?, ?, ?)",
+                                       (device, label, table,
+                                        json.dumps({"columns": rows.columns, "data": rows.data,
+                                                    "devices": rows.devices})))
+                connection.execute("UPDATE tasks SET state = 'done', owner = NULL "
+                                   "WHERE device = ?", (device,))
+            connection.execute("COMMIT")
+
+    def fail(self, device, owner, error):
+        """
+        Give up the lease of a device that could not be collected, so that
+        it is tried again if it has attempts left.
+        """
+        with self.connect() as connection:
+            connection.execute("UPDATE tasks SET state = CASE WHEN attempts < ? THEN 'pending' "
+                               "ELSE 'failed' END, owner = NULL, error = ? "
+                               "WHERE device = ? AND owner = ?",
+                               (self.max_attempts, str(error), device, owner))
+
+    def unfinished(self):
+        """
+        :return: number of devices that are not done and have not failed
+        """
+        with self.connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM tasks WHERE state IN "
+                                      "('pending', 'leased')").fetchone()[0]
+
+    def unfinished_devices(self):
+        """
+        :return: list of tuples with the name and state of the devices that
+        are not done and have not failed
+        """
+        with self.connect() as connection:
+            return connection.execute("SELECT device, state FROM tasks WHERE state IN "
+                                      "('pending', 'leased') ORDER BY device").fetchall()
+
+    def failed(self):
+        """
+        :return: list of tuples with the name and error of the devices that
+        failed
+        """
+        with self.connect() as connection:
+            return connection.execute("SELECT device, error FROM tasks WHERE state = 'failed' "
+                                      "ORDER BY device").fetchall()
+
+    def results(self):
+        """
+        Go through the tables saved by the workers.
+        :return: generator of tuples with the device, platform label, table
+        and Table
+        """
+        with self.connect() as connection:
+            for device, label, table, rows in connection.execute(
+                    "SELECT device, label, table_name, rows FROM results ORDER BY rowid"):
+                rows = json.loads(rows)
+                device_table = Table(rows["columns"])
+                device_table.data = rows["data"]
+                device_table.devices = [tuple(entry) for entry in rows["devices"]]
+                yield device, label, table, device_table
+
+
+def run_shard_worker(work_queue, shard, devices, max_workers=DEFAULT_WORKERS,
+                     timeout=DEFAULT_TIMEOUT, cache=None, offline=False):
+    """
+    Collect the devices of a shard of the work queue, and then those left
+    in the other shards, on max_workers threads. The threads keep going
+    until every device of the queue is done or has failed, so the devices
+    whose worker died are collected again once their lease runs out.
+    """
+    lease = 2 * timeout + 60
+
+    def run_worker():
+        # every thread leases devices of its own, so that a thread whose
+        # lease ran out cannot finish a device another thread leased again
+        owner = f"{socket.gethostname()}-{os.getpid()}-{shard}-{threading.get_ident()}"
+        while work_queue.unfinished():
+            device = work_queue.claim(shard, owner, lease)
+            if device is None:
+                time.sleep(SHARD_POLL_INTERVAL)
+                continue
+            if device not in devices:
+                work_queue.fail(device, owner, "the device is not in the testbed")
+                continue
+            node = devices[device]
+            commands = platform_commands(node.os)
+            try:
+                outputs = fetch_outputs(device, node, commands, timeout, cache, offline)
+                device_tables = parse_outputs(device_details(device, node), node, commands,
+                                              outputs)
+            except Exception as e:
+                print(f"There was an issue collecting {device}")
+                print(e)
+                profiler.error("collect", device, None, e)
+                work_queue.fail(device, owner, e)
+                continue
+            work_queue.complete(device, owner, PLATFORMS[node.os]["label"], device_tables)
+
+    threads = [threading.Thread(target=run_worker) for index in range(max_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def merge_shards(work_queue, sink):
+    """
+    Write the tables saved by the workers of the work queue to the sink,
+    and print the devices that could not be collected, along with those
+    that no worker finished, so a partial output does not go unnoticed.
+    """
+    for device, label, table, rows in work_queue.results():
+        with profiler.timed("write", device, table):
+            sink.write(label, table, rows)
+    for device, error in work_queue.failed():
+        print(f"There was an issue collecting {device}")
+        print(error)
+    for device, state in work_queue.unfinished_devices():
+        print(f"{device} was not collected, it is still {state} in the work queue")
 
-        if show_interface:
-            ios_info["interfaces"].extend(parse_interfaces(show_interface, device_info))
-        if cpu_processes:
-            ios_info["cpu_processes"].extend(parse_cpu_process(cpu_processes, device_info))
-        if memory_processes:
-            ios_info["memory_processes"].extend(parse_memory_process(memory_processes, device_info))
-        if ospf_neighbors:
-            ios_info["ospf_neighbors"].extend(parse_ospf_neighbor(ospf_neighbors, device_info))
+def start_shard_workers(args, shards):
+    """
+    Start a worker process of this script for each shard, with the options
+    of the collection.
+    :return: list of the processes
+    """
+    worker_args = [sys.executable, os.path.abspath(__file__), "--queue", args.queue,
+                   "--testbed", args.testbed, "--workers", str(args.workers),
+                   "--timeout", str(args.timeout), "--cache-dir", args.cache_dir,
+                   "--cache-ttl", str(args.cache_ttl), "--cache-size", str(args.cache_size)]
+    if args.no_cache:
+        worker_args.append("--no-cache")
+    if args.offline:
+        worker_args.append("--offline")
+    return [subprocess.Popen(worker_args + ["--shard-worker", str(shard)])
+            for shard in range(shards)]
 
-    return ios_info
+def parse_interval(value):
+    """
+    Read an interval given on the command line as table=seconds.
+    :return: tuple of the table and the number of seconds
+    """
+    table, _, seconds = value.partition("=")
+    if table not in TABLES or not seconds.isdigit() or int(seconds) == 0:
+        raise argparse.ArgumentTypeError(f"{value} is not one of {', '.join(TABLES)} "
+                                         "followed by =seconds")
+    return table, int(seconds)
+
+def parse_args(argv):
+    """
+    Read the command line options of the script.
+    :return: namespace with the options
+    """
+    parser = argparse.ArgumentParser(description="Collect interface, CPU, memory, "
+                                     "and OSPF information from the devices in the "
+                                     "testbed and write it to an Excel file or "
+                                     "columnar files.")
+    parser.add_argument("--testbed", default="./network_testbed.yml",
+                        help="testbed file with the devices")
+    parser.add_argument("--device", action="append", default=None,
+                        help="only collect this device (can be repeated)")
+    parser.add_argument("--site", action="append", default=None,
+                        help="only collect the devices of this site (can be repeated)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of devices collected at the same time")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count(),
+                        help="number of processes the outputs are parsed in, or 0 to "
+                        "parse them in the threads that collect them")
+    parser.add_argument("--site-limit", type=int, default=None,
+                        help="number of devices of the same site collected at "
+                        "the same time")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT,
+                        help="seconds each device has to connect and run its commands")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="xlsx",
+                        help="format the tables are written in")
+    parser.add_argument("--output", default=None,
+                        help="file the Excel workbook is written to, or directory "
+                        "the columnar files are written to")
+    parser.add_argument("--delta", action="store_true",
+                        help="only write the rows that were added, removed or changed "
+                        "since the previous run")
+    parser.add_argument("--snapshot", default="snapshot.json",
+                        help="file the rows of the previous run are kept in for --delta")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep polling the devices until the script is interrupted")
+    parser.add_argument("--interval", type=parse_interval, action="append", default=[],
+                        metavar="TABLE=SECONDS",
+                        help="seconds between the polls of a table in daemon mode, for "
+                        "example interfaces=300")
+    parser.add_argument("--flush-interval", type=int, default=DEFAULT_FLUSH_INTERVAL,
+                        help="seconds between the output files written in daemon mode")
+    parser.add_argument("--history-dir", default="history",
+                        help="directory the history of the interface counters and the "
+                        "process memory is kept in")
+    parser.add_argument("--no-history", action="store_true",
+                        help="do not keep the history or write the utilization and "
+                        "memory leak reports")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help="seconds of history the utilization reports are computed over")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP,
+                        help="number of interfaces in the busiest and errors reports, "
+                        "and of processes in the memory leak report")
+    parser.add_argument("--leak-window", type=int, default=DEFAULT_LEAK_WINDOW,
+                        help="seconds of history the memory leak report is computed over")
+    parser.add_argument("--leak-samples", type=int, default=DEFAULT_LEAK_SAMPLES,
+                        help="number of the latest samples of each process the memory "
+                        "leak report fits the growth of its memory to")
+    parser.add_argument("--ospf-graph", default=None, metavar="PATH",
+                        help="write the OSPF topology of the fleet to this JSON file")
+    parser.add_argument("--profile", default=None,
+                        help="file the timing of every device and command is written to "
+                        "as JSON lines, followed by a summary of the slowest ones")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="port the timings are served on for Prometheus in daemon mode")
+    parser.add_argument("--cache-dir", default="cli_cache",
+                        help="directory the raw output of the commands is cached in")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="do not cache the raw output of the commands")
+    parser.add_argument("--cache-ttl", type=int, default=DEFAULT_CACHE_TTL,
+                        help="seconds the raw output of a command is kept in the cache")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help="bytes the cache can grow to before the oldest output "
+                        "is removed")
+    parser.add_argument("--offline", "--replay", action="store_true",
+                        help="parse the cached output of the commands instead of "
+                        "connecting to the devices")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="split the devices into this number of shards, collect them "
+                        "with a worker process each and merge their results")
+    parser.add_argument("--shard-by", choices=["name", "site"], default="name",
+                        help="split the devices by the hash of their name or of their site")
+    parser.add_argument("--queue", default="work_queue.db",
+                        help="SQLite file the shards and their results are kept in")
+    parser.add_argument("--enqueue", action="store_true",
+                        help="with --shards, only create the queue so that the workers can "
+                        "be started on other hosts")
+    parser.add_argument("--shard-worker", type=int, default=None, metavar="SHARD",
+                        help="collect the devices of this shard of the queue and exit")
+    parser.add_argument("--merge", action="store_true",
+                        help="only write the results of the queue to the output")
+    args = parser.parse_args(argv[1:])
+    if args.daemon and (args.offline or args.output_format == "xlsx"):
+        parser.error("--daemon writes columnar files while it polls the devices and "
+                     "needs an --output-format other than xlsx, without --offline")
+    if args.offline and args.no_cache:
+        parser.error("--offline reads the output from the cache and cannot be "
+                     "used with --no-cache")
+    sharded = args.shards or args.shard_worker is not None or args.merge
+    if args.daemon and sharded:
+        parser.error("--daemon cannot be used with --shards, --shard-worker or --merge")
+    if args.enqueue and not args.shards:
+        parser.error("--enqueue needs --shards")
+    return args
 
 def main(argv):
-    # retrieve the devices we will connect to from the network testbed YAML file
-    testbed_list = testbed.load(f"./network_testbed.yml")
-    devices = testbed_list.devices
+    args = parse_args(argv)
+    if args.profile:
+        profiler.open(args.profile)
 
-    nxos_devices = {}
-    ios_devices = {}
+    # retrieve the devices we will connect to from the network testbed YAML
+    # file, keeping the devices of the platforms we know the commands for;
+    # in a sharded collection only the workers connect to the devices
+    supported_devices = load_devices(args.testbed, args.offline or args.merge
+                                     or (args.shards is not None and args.shard_worker is None),
+                                     args.device, args.site)
 
-    # separate the IOS devices from the Nexus devices
-    for device in devices:
-        node = devices[device]
-        if node.os == "nxos":
-            nxos_devices[device] = node
-        elif node.os == "ios" or node.os == "iosxe":
-            ios_devices[device] = node
-
-    # run and parse the results of the commands on the devices
-    if nxos_devices != {}:
-        # the Nexus commands are slightly different from the IOS devices
-        nxos_info = run_nxos_commands(nxos_devices)
+    if args.no_cache:
+        cache = None
     else:
-        nxos_info = {}
+        cache = OutputCache(args.cache_dir, args.cache_ttl, args.cache_size)
 
-    if ios_devices != {}:
-        ios_info = run_ios_commands(ios_devices)
-    else:
-        ios_info = {}
-
-    # create an Excel file with sheets for each of the IOS and Nexus commands
-    # highlight the cells of the interfaces sheets that represent shutdown interfaces in red
-    with pd.ExcelWriter("network_analytics.xlsx") as writer:
-        workbook = writer.book
-        if nxos_info:
-            nxos_interface_df = pd.DataFrame.from_dict(nxos_info["interfaces"])
-            nxos_cpu_df = pd.DataFrame.from_dict(nxos_info["cpu_processes"])
-            nxos_memory_df = pd.DataFrame.from_dict(nxos_info["memory_processes"])
-            nxos_ospf_df = pd.DataFrame.from_dict(nxos_info["ospf_neighbors"])
-
-            nxos_interface_df.to_excel(writer, sheet_name="NXOS Interfaces")
-            nxos_cpu_df.to_excel(writer, sheet_name="NXOS CPU Processes")
-            nxos_memory_df.to_excel(writer, sheet_name="NXOS Memory Processes")
-            nxos_ospf_df.to_excel(writer, sheet_name="NXOS OSPF Neighbors")
-
-            nxos_interfaces_sheet = workbook.get_worksheet_by_name("NXOS Interfaces")
-            error_format = workbook.add_format({"bg_color": "red"})
-            interface_len = len(nxos_info["interfaces"])
-            cell_range = "E1:E" + str(interface_len)
-            nxos_interfaces_sheet.conditional_format(cell_range,
-                                                     {"type": "text",
-                                                      "criteria": "containing",
-                                                      "value": "FALSE",
-                                                      "format": error_format})
-
-
-
-        if ios_info:
-            ios_interface_df = pd.DataFrame.from_dict(ios_info["interfaces"])
-            ios_cpu_df = pd.DataFrame.from_dict(ios_info["cpu_processes"])
-            ios_memory_df = pd.DataFrame.from_dict(ios_info["memory_processes"])
-            ios_ospf_df = pd.DataFrame.from_dict(ios_info["ospf_neighbors"])
-
-            ios_interface_df.to_excel(writer, sheet_name="IOS Interfaces")
-            ios_cpu_df.to_excel(writer, sheet_name="IOS CPU Processes")
-            ios_memory_df.to_excel(writer, sheet_name="IOS Memory Processes")
-            ios_ospf_df.to_excel(writer, sheet_name="IOS OSPF Neighbors")
-
-            ios_interfaces_sheet = workbook.get_worksheet_by_name("IOS Interfaces")
-            error_format = workbook.add_format({"bg_color": "red"})
-            interface_len = len(ios_info["interfaces"])
-            cell_range = "E1:E" + str(interface_len)
-            ios_interfaces_sheet.conditional_format(cell_range,
-                                                     {"type": "text",
-                                                      "criteria": "containing",
-                                                      "value": "FALSE",
-                                                      "format": error_format})
+    if args.shard_worker is not None:
+        run_shard_worker(WorkQueue(args.queue), args.shard_worker, supported_devices,
+                         args.workers, args.timeout, cache, args.offline)
+        if cache and not args.offline:
+            cache.save()
+        return
+    if args.shards:
+        work_queue = WorkQueue(args.queue)
+        work_queue.enqueue(supported_devices, args.shards, args.shard_by)
+        if args.enqueue:
+            return
+        for shard, process in enumerate(start_shard_workers(args, args.shards)):
+            if process.wait():
+                print(f"The worker of shard {shard} exited with code {process.returncode}")
+
+    # create the output with a sheet or file for each of the platforms and
+    # commands and write the results of each device to it as soon as they arrive
+    platforms = {node.os for node in supported_devices.values()}
+    labels = []
+    for platform in PLATFORMS:
+        if platform in platforms and PLATFORMS[platform]["label"] not in labels:
+            labels.append(PLATFORMS[platform]["label"])
+    output_format = OUTPUT_FORMATS[args.output_format]
+    output_path = args.output or output_format["path"]
+    if args.delta:
+        snapshot = SnapshotStore(args.snapshot)
+    histories = {}
+    reports = []
+    if not args.no_history:
+        histories["interface_counters"] = SeriesStore(
+            os.path.join(args.history_dir, "interface_counters"), ["interface"],
+            INTERFACE_COUNTER_COLUMNS[1:])
+        reports.append(partial(interface_utilization, histories["interface_counters"],
+                               args.window, args.top))
+        histories["process_memory"] = SeriesStore(
+            os.path.join(args.history_dir, "process_memory"), ["p_id", "process"], ["memory"])
+        reports.append(partial(memory_leaks, histories["process_memory"], args.leak_window,
+                               args.leak_samples, args.top))
+
+    # the OSPF graph is built from the latest rows of every device, which
+    # outlive the sinks the daemon creates on every flush
+    latest = LatestRows({"ospf_neighbors": OSPF_NEIGHBOR_COLUMNS,
+                         "interface_addresses": INTERFACE_ADDRESS_COLUMNS})
+
+    def create_sink():
+        if args.daemon:
+            # every file written by the daemon goes to its own directory
+            path = os.path.join(output_path, f"{datetime.now():%Y%m%d-%H%M%S}")
+        else:
+            path = output_path
+        sink = output_format["sink"](path, labels)
+        if args.delta:
+            sink = DeltaSink(sink, snapshot)
+        return TopologySink(HistorySink(sink, histories, reports), latest, args.ospf_graph)
+
+    if args.daemon:
+        if args.metrics_port:
+            serve_metrics(args.metrics_port)
+        intervals = dict(DEFAULT_INTERVALS)
+        intervals.update(args.interval)
+        with create_parse_executor(args.parse_workers) or nullcontext() as parse_executor:
+            poll_devices(supported_devices, create_sink, intervals, args.flush_interval,
+                         args.workers, args.site_limit, args.timeout, cache, parse_executor)
+        if args.profile:
+            profiler.print_summary()
+        return
+
+    if args.shards or args.merge:
+        sink = create_sink()
+        try:
+            merge_shards(WorkQueue(args.queue), sink)
+        finally:
+            with profiler.timed("write", None, "close"):
+                sink.close()
+        if args.profile:
+            profiler.print_summary()
+        return
 
+    # run and parse the results of the commands on the devices of every
+    # platform in a single pass
+    sink = create_sink()
+    try:
+        with create_parse_executor(args.parse_workers) or nullcontext() as parse_executor:
+            collect_devices(supported_devices, sink, args.workers, args.site_limit,
+                            args.timeout, cache, args.offline, parse_executor)
+    finally:
+        with profiler.timed("write", None, "close"):
+            sink.close()
+    if cache and not args.offline:
+        cache.save()
+    if args.profile:
+        profiler.print_summary()
 
 
 if __name__ == "__main__":
-    sys.exit(main(sys.argv))
\ No newline at end of file
+    sys.exit(main(sys.argv))
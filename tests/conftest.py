@@ -0,0 +1,96 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# the script is not a package, so the tests import it from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeDevice:
+    """
+    A device that takes delay seconds to run every command, or until the
+    timeout of the command if that comes first. The outputs are parsed into
+    the dictionary of parsed for the command, or into an empty result as if
+    the command returned nothing.
+    """
+
+    def __init__(self, delay=0, site="default", os="iosxe", parsed=None):
+        self.os = os
+        self.connections = {"cli": {"ip": "192.0.2.1"}}
+        self.custom = {"site": site}
+        self.delay = delay
+        self.parsed = parsed or {}
+        self.connected = False
+        self.executed = []
+        self.lock = threading.Lock()
+
+    def connect(self, **kwargs):
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+    def disconnect(self):
+        self.connected = False
+
+    def execute(self, command, timeout=None):
+        if timeout is not None and self.delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"{command} timed out after {timeout} seconds")
+        time.sleep(self.delay)
+        with self.lock:
+            self.executed.append(command)
+        return command
+
+    def parse(self, command, output=None):
+        return self.parsed.get(command, {})
+
+
+class FakeSink:
+    """
+    A sink that keeps everything written to it.
+    """
+
+    def __init__(self, *args):
+        self.writes = []
+        self.reports = {}
+        self.closed = False
+
+    def write(self, label, table, rows):
+        self.writes.append((label, table, rows))
+
+    def write_report(self, table, title, frame):
+        self.reports[table] = frame
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_device():
+    """
+    :return: the FakeDevice class, to create the devices of a test
+    """
+    return FakeDevice
+
+
+@pytest.fixture
+def sink():
+    return FakeSink()
+
+
+@pytest.fixture
+def make_sink():
+    """
+    :return: function that creates a FakeSink and keeps it in its created
+    list, for the code that creates a sink of its own
+    """
+    def make_sink(*args):
+        make_sink.created.append(FakeSink())
+        return make_sink.created[-1]
+
+    make_sink.created = []
+    return make_sink
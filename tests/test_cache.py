@@ -0,0 +1,93 @@
+"""
+Store, expire, evict and replay the raw outputs of the OutputCache.
+"""
+import hashlib
+import multiprocessing
+import os
+
+import network_analytics
+
+COMMANDS = [{"command": "show interfaces", "description": "interfaces"},
+            {"command": "show processes cpu", "description": "CPU processes"}]
+
+
+def expire(cache, device, command, seconds):
+    # move an output back in time instead of waiting for it to expire
+    cache.latest[(device, command)]["timestamp"] -= seconds
+
+
+def test_outputs_expire_after_the_ttl(tmp_path):
+    cache = network_analytics.OutputCache(str(tmp_path), ttl=60)
+    cache.store("switch1", "show version", "old")
+    cache.store("switch2", "show version", "new")
+    expire(cache, "switch1", "show version", 120)
+    assert cache.load("switch1", "show version") is None
+    assert cache.load("switch2", "show version") == "new"
+
+    cache.save()
+    assert [entry["device"] for entry in cache.entries] == ["switch2"]
+    assert not os.path.exists(cache.object_path(hashlib.sha256(b"old").hexdigest()))
+    assert network_analytics.OutputCache(str(tmp_path)).load("switch2", "show version") == "new"
+
+
+def test_eviction_keeps_the_objects_still_shared(tmp_path):
+    cache = network_analytics.OutputCache(str(tmp_path), max_size=10)
+    cache.store("switch1", "show version", "aaaaaa")
+    cache.store("switch2", "show version", "bbbbbb")
+    # the same output as switch1, stored only once
+    cache.store("switch3", "show version", "aaaaaa")
+    assert len(os.listdir(os.path.join(str(tmp_path), "objects"))) == 2
+    cache.save()
+
+    # switch1 and switch2 are evicted, but the output of switch1 is still
+    # that of switch3
+    assert [entry["device"] for entry in cache.entries] == ["switch3"]
+    assert cache.load("switch1", "show version") is None
+    assert cache.load("switch2", "show version") is None
+    assert cache.load("switch3", "show version") == "aaaaaa"
+    digest = hashlib.sha256(b"bbbbbb").hexdigest()
+    assert not os.path.exists(cache.object_path(digest))
+
+
+def store_outputs(path, worker):
+    cache = network_analytics.OutputCache(path)
+    for index in range(20):
+        cache.store(f"worker{worker}-switch{index}", "show version", f"{worker}-{index}")
+        cache.save()
+
+
+def test_processes_merge_their_index(tmp_path):
+    # every process saves its index while the others save theirs
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=store_outputs, args=(str(tmp_path), worker))
+               for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    cache = network_analytics.OutputCache(str(tmp_path))
+    assert len(cache.entries) == 80
+    for worker in range(4):
+        for index in range(20):
+            assert (cache.load(f"worker{worker}-switch{index}", "show version")
+                    == f"{worker}-{index}")
+
+
+def test_offline_replays_the_cached_outputs(tmp_path, make_device):
+    cache = network_analytics.OutputCache(str(tmp_path))
+    outputs = network_analytics.fetch_outputs("switch1", make_device(), COMMANDS, 5, cache)
+    cache.save()
+
+    device = make_device()
+    cache = network_analytics.OutputCache(str(tmp_path))
+    replayed = network_analytics.fetch_outputs("switch1", device, COMMANDS, 5, cache,
+                                               offline=True)
+    assert replayed == outputs == ["show interfaces", "show processes cpu"]
+    assert not device.connected
+    assert device.executed == []
+
+    # a device that was never collected has no outputs to replay
+    assert network_analytics.fetch_outputs("switch2", device, COMMANDS, 5, cache,
+                                           offline=True) == [None, None]
@@ -0,0 +1,41 @@
+"""
+Collect fake devices that sleep instead of running the commands, to check
+that the devices are collected at the same time and that a device that
+hangs is cut off at its timeout.
+"""
+import time
+
+import network_analytics
+
+
+def collect(devices, sink, **kwargs):
+    start = time.monotonic()
+    network_analytics.collect_devices(devices, sink, **kwargs)
+    return time.monotonic() - start
+
+
+def test_devices_are_collected_at_the_same_time(make_device, sink):
+    devices = {f"device{index}": make_device(0.05) for index in range(20)}
+    # 4 commands of 0.05 seconds on each of the 20 devices
+    elapsed = collect(devices, sink, max_workers=20)
+    assert elapsed < 20 * 0.2 / 4
+    assert all(len(device.executed) == 4 for device in devices.values())
+
+
+def test_site_limit_spreads_the_devices_of_a_site(make_device, sink):
+    devices = {f"device{index}": make_device(0.05, site="dc1") for index in range(4)}
+    elapsed = collect(devices, sink, max_workers=4, site_limit=1)
+    assert elapsed >= 4 * 0.2
+
+
+def test_hung_device_is_cut_off_at_its_timeout(make_device, sink):
+    devices = {"hung": make_device(60), "fine": make_device(0.05)}
+    network_analytics.profiler.totals.clear()
+    elapsed = collect(devices, sink, max_workers=2, timeout=1)
+    # the first command gets the whole timeout and the rest do not start
+    assert elapsed < 5
+    assert len(devices["fine"].executed) == 4
+    errors = sum(errors for (device, stage, command), (calls, seconds, errors)
+                 in network_analytics.profiler.totals.items()
+                 if device == "hung" and stage == "execute")
+    assert errors == 4
@@ -0,0 +1,59 @@
+"""
+Poll fake devices with the daemon for a second at a time, interrupting it
+as the script would be interrupted.
+"""
+import _thread
+import threading
+
+import network_analytics
+
+
+# every process is missing its fields, so the cpu processes cannot be flattened
+BROKEN_CPU = {"show processes cpu": {"index": {1: {}}}}
+
+
+def poll(devices, make_sink, intervals, flush_interval, seconds):
+    timer = threading.Timer(seconds, _thread.interrupt_main)
+    timer.start()
+    try:
+        network_analytics.poll_devices(devices, make_sink, intervals, flush_interval,
+                                       max_workers=2)
+    finally:
+        timer.cancel()
+    return make_sink.created
+
+
+def test_flattening_errors_are_recorded(make_device, make_sink):
+    network_analytics.profiler.totals.clear()
+    poll({"router1": make_device(parsed=BROKEN_CPU)}, make_sink, {"cpu_processes": 0.2}, 60, 1)
+    errors = network_analytics.profiler.totals[("router1", "flatten", "show processes cpu")]
+    assert errors[2] >= 1
+    assert network_analytics.profiler.totals[("router1", "parse", None)][2] >= 1
+
+
+def test_flushes_do_not_wait_for_the_next_poll(make_device, make_sink):
+    sinks = poll({"router1": make_device(parsed=BROKEN_CPU)}, make_sink, {"cpu_processes": 600},
+                 0.2, 1)
+    assert len(sinks) >= 4
+    assert all(sink.closed for sink in sinks)
+
+
+def test_running_polls_reach_the_last_sink(make_device, make_sink):
+    cpu = {"show processes cpu": {"index": {1: {"invoked": 10, "pid": 1, "process": "init",
+                                                "runtime_ms": 3, "usecs": 7}}}}
+    device = make_device(delay=0.6, parsed=cpu)
+    execute = device.execute
+    disconnected_during_execute = []
+
+    def checked_execute(command, timeout=None):
+        output = execute(command, timeout)
+        disconnected_during_execute.append(not device.connected)
+        return output
+
+    device.execute = checked_execute
+    # the daemon is interrupted while the first poll is still running
+    [sink] = poll({"router1": device}, make_sink, {"cpu_processes": 0.01}, 60, 0.3)
+    assert disconnected_during_execute == [False]
+    assert not device.connected
+    assert [(label, table) for label, table, rows in sink.writes] == [("IOS", "cpu_processes")]
+    assert sink.closed
@@ -0,0 +1,77 @@
+"""
+Compare the rows of a device with those of the previous run, including a
+device whose last rows are gone.
+"""
+import sys
+import types
+
+import network_analytics
+
+DEVICE = {"name": "router1", "ip": "192.0.2.1"}
+
+
+def neighbors(*interfaces):
+    table = network_analytics.Table(network_analytics.OSPF_NEIGHBOR_COLUMNS)
+    for interface in interfaces:
+        table.append(["default", "1", "0.0.0.0", interface, "10.0.0.2", "10.0.0.2", "10.1.1.2",
+                      "full", 1, "n/a", "n/a", "00:00:35"])
+    table.add_device(DEVICE, len(interfaces))
+    return table
+
+
+def test_changes_are_found(tmp_path):
+    store = network_analytics.SnapshotStore(str(tmp_path / "snapshot.json"))
+    assert [row["change"] for row in store.diff("IOS", "ospf_neighbors",
+                                                neighbors("Gi1", "Gi2")).rows()] == ["added",
+                                                                                     "added"]
+    changes = store.diff("IOS", "ospf_neighbors", neighbors("Gi1"))
+    assert [(row["change"], row["interface"]) for row in changes.rows()] == [("removed", "Gi2")]
+
+
+def test_empty_output_removes_the_last_rows(tmp_path, make_device):
+    commands = network_analytics.platform_commands("iosxe", ["ospf_neighbors"])
+    device_tables = network_analytics.parse_outputs(DEVICE, make_device(), commands, [""])
+    assert len(device_tables["ospf_neighbors"]) == 0
+
+    store = network_analytics.SnapshotStore(str(tmp_path / "snapshot.json"))
+    store.diff("IOS", "ospf_neighbors", neighbors("Gi1"))
+    changes = store.diff("IOS", "ospf_neighbors", device_tables["ospf_neighbors"])
+    assert [(row["change"], row["interface"]) for row in changes.rows()] == [("removed", "Gi1")]
+    assert store.snapshot["IOS ospf_neighbors"]["router1"] == {}
+
+
+def test_failed_command_keeps_the_last_rows(make_device):
+    commands = network_analytics.platform_commands("iosxe", ["ospf_neighbors"])
+    assert network_analytics.parse_outputs(DEVICE, make_device(), commands, [None]) == {}
+
+
+def test_history_skips_devices_without_rows(tmp_path, make_device):
+    history = network_analytics.SeriesStore(str(tmp_path), ["interface"],
+                                            network_analytics.INTERFACE_COUNTER_COLUMNS[1:])
+    commands = network_analytics.platform_commands("iosxe", ["interfaces"])
+    device_tables = network_analytics.parse_outputs(DEVICE, make_device(), commands, [""])
+    history.append(device_tables["interface_counters"])
+    history.save()
+    assert history.chunks() == []
+
+
+def test_empty_output_is_not_a_parse_error(monkeypatch, make_device):
+    # the exception Genie raises for an output without anything to parse
+    class SchemaEmptyParserError(Exception):
+        pass
+
+    exceptions = types.ModuleType("genie.metaparser.util.exceptions")
+    exceptions.SchemaEmptyParserError = SchemaEmptyParserError
+    monkeypatch.setitem(sys.modules, "genie.metaparser.util.exceptions", exceptions)
+    profiler = network_analytics.Profiler()
+    monkeypatch.setattr(network_analytics, "profiler", profiler)
+
+    def parse(command, output=None):
+        raise SchemaEmptyParserError(f"Parser Output is empty for {command}")
+
+    device = make_device()
+    device.parse = parse
+    assert network_analytics.parse_command(device, "router1", "show ip ospf neighbor detail",
+                                           "OSPF neighbors", "") == {}
+    calls, seconds, errors = profiler.totals[("router1", "parse", "show ip ospf neighbor detail")]
+    assert (calls, errors) == (1, 0)
@@ -0,0 +1,72 @@
+"""
+Compute the utilization and the errors of the interfaces from a history of
+interface counters.
+"""
+import time
+
+import pytest
+
+import network_analytics
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+
+def counters_history(path, samples):
+    history = network_analytics.SeriesStore(path, ["interface"],
+                                            network_analytics.INTERFACE_COUNTER_COLUMNS[1:])
+    now = time.time()
+    for sample in range(samples):
+        table = network_analytics.Table(network_analytics.INTERFACE_COUNTER_COLUMNS)
+        # the counters of Ethernet1/3 are cleared halfway
+        cleared = 100 + sample if sample < samples // 2 else sample
+        # the bandwidth is in kbit/s and the rates in bit/s
+        rows = [("Ethernet1/1", 1000000, sample * 50000000, 0, 0, 0, 0, 0),
+                ("Ethernet1/2", 100000, 0, 50000000, 0, 0, sample * 3, 0),
+                ("Ethernet1/3", 100000, 0, 0, 0, 0, cleared, 0),
+                ("Ethernet1/4", "n/a", 1000, 1000, 0, 0, 0, sample)]
+        for row in rows:
+            table.append(row)
+        table.add_device({"name": "switch1", "ip": "192.0.2.1"}, len(rows))
+        history.pending.append((now - (samples - sample) * 60, table))
+    history.save()
+    return history
+
+
+def reports(history, **kwargs):
+    return {table: frame.set_index("interface")
+            for table, title, frame in network_analytics.interface_utilization(history, **kwargs)}
+
+
+def test_utilization_is_a_percent_of_the_bandwidth(tmp_path):
+    summary = reports(counters_history(str(tmp_path), 20))["interface_utilization"]
+    assert summary.loc["Ethernet1/1", "utilization"] == pytest.approx(95)
+    assert summary.loc["Ethernet1/2", "utilization"] == pytest.approx(50)
+    assert summary["utilization"].isna()["Ethernet1/4"]
+    assert (summary["samples"] == 20).all()
+
+
+def test_p95_covers_the_window(tmp_path):
+    history = counters_history(str(tmp_path), 20)
+    summary = reports(history)["interface_utilization"]
+    # the utilization went from 0% to 95% in steps of 5%
+    assert summary.loc["Ethernet1/1", "p95_utilization"] == pytest.approx(90.25)
+    assert summary.loc["Ethernet1/2", "p95_utilization"] == pytest.approx(50)
+
+    # only the samples of the last 10 minutes, from 50% to 95%
+    summary = reports(history, window=10 * 60 + 1)["interface_utilization"]
+    assert summary.loc["Ethernet1/1", "samples"] == 10
+    assert summary.loc["Ethernet1/1", "p95_utilization"] == pytest.approx(92.75)
+
+
+def test_cleared_counters_count_no_errors(tmp_path):
+    summary = reports(counters_history(str(tmp_path), 20))["interface_utilization"]
+    assert summary.loc["Ethernet1/2", "errors"] == 57
+    assert summary.loc["Ethernet1/3", "errors"] == 0
+    assert summary.loc["Ethernet1/4", "errors"] == 19
+
+
+def test_top_interfaces(tmp_path):
+    frames = reports(counters_history(str(tmp_path), 20), top=2)
+    assert list(frames["busiest_interfaces"].index) == ["Ethernet1/1", "Ethernet1/2"]
+    assert list(frames["interface_errors"].index) == ["Ethernet1/2", "Ethernet1/4"]
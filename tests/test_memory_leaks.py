@@ -0,0 +1,54 @@
+"""
+Find memory leak suspects in a history of process memory samples.
+"""
+import time
+
+import pytest
+
+import network_analytics
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+
+def memory_history(path, samples):
+    history = network_analytics.SeriesStore(path, ["p_id", "process"], ["memory"])
+    now = time.time()
+    for sample in range(samples):
+        table = network_analytics.Table(network_analytics.PROCESS_MEMORY_COLUMNS)
+        rows = [(1, "leaky", 1000 + sample * 100),
+                # the process id 2 is taken over by another process halfway
+                (2, "old" if sample < samples // 2 else "new", 500 + sample * 10),
+                (3, "steady", 700),
+                (4, "restarted", 100 + (sample if sample > 5 else -sample)),
+                # processes with the same id and name are added up
+                (0, "*Dead*", 10 + sample), (0, "*Dead*", 20)]
+        for row in rows:
+            table.append(row)
+        table.add_device({"name": "router1", "ip": "192.0.2.1"}, len(rows))
+        history.pending.append((now - (samples - sample) * 60, table))
+    history.save()
+    return history
+
+
+def suspects(history, **kwargs):
+    [(table, title, frame)] = network_analytics.memory_leaks(history, **kwargs)
+    return frame
+
+
+def test_leaking_processes_are_ranked_by_slope(tmp_path):
+    frame = suspects(memory_history(str(tmp_path), 20), samples=12)
+    assert list(frame["process"]) == ["leaky", "new", "*Dead*", "restarted"]
+    assert frame["slope_per_hour"].iloc[0] == pytest.approx(6000)
+    assert frame["last"].iloc[2] == 49
+
+
+def test_growth_that_dropped_in_the_window_is_not_a_leak(tmp_path):
+    frame = suspects(memory_history(str(tmp_path), 20), samples=20)
+    assert "restarted" not in list(frame["process"])
+
+
+def test_processes_that_stopped_reporting_are_not_ranked(tmp_path):
+    frame = suspects(memory_history(str(tmp_path), 20), samples=20)
+    assert "old" not in list(frame["process"])
+    assert "new" in list(frame["process"])
@@ -0,0 +1,82 @@
+"""
+Flatten recorded Genie outputs of show ip ospf neighbor detail on IOS-XE
+and NX-OS, and time the flattening of a large OSPF domain.
+"""
+import json
+import os
+import time
+
+import network_analytics
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DEVICE = {"name": "router1", "ip": "192.0.2.1"}
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as fixture:
+        return json.load(fixture)
+
+
+def neighbor_rows(name):
+    output = load_fixture(name)["vrf"]
+    return list(network_analytics.parse_ospf_neighbor(output, DEVICE).rows())
+
+
+def test_iosxe_neighbors():
+    rows = neighbor_rows("iosxe_show_ip_ospf_neighbor_detail.json")
+    assert [row["interface"] for row in rows] == ["GigabitEthernet2", "GigabitEthernet3"]
+    assert rows[0] == {"device": "router1", "ip": "192.0.2.1", "vrf": "default",
+                       "process_id": "1", "area": "0.0.0.0", "interface": "GigabitEthernet2",
+                       "neighbor": "10.16.2.2", "router_id": "10.16.2.2",
+                       "address": "10.169.197.94", "state": "full", "priority": 0,
+                       "dr_ip": "0.0.0.0", "bdr_ip": "0.0.0.0", "dead_time": "00:00:32"}
+
+
+def test_dead_timer_is_used_without_dead_time():
+    rows = neighbor_rows("iosxe_show_ip_ospf_neighbor_detail.json")
+    assert rows[0]["dead_time"] == "00:00:32"
+
+
+def test_missing_fields_are_not_available():
+    rows = neighbor_rows("iosxe_show_ip_ospf_neighbor_detail.json")
+    for column in ["priority", "dr_ip", "bdr_ip", "dead_time"]:
+        assert rows[1][column] == "n/a"
+
+
+def test_nxos_neighbors():
+    rows = neighbor_rows("nxos_show_ip_ospf_neighbors_detail.json")
+    assert [(row["vrf"], row["area"], row["interface"], row["state"], row["dead_time"])
+            for row in rows] == [("default", "0.0.0.0", "Ethernet1/2", "full", "00:00:39"),
+                                 ("default", "0.0.0.0", "Ethernet1/4", "full", "00:00:33"),
+                                 ("VRF1", "0.0.0.1", "Ethernet1/3", "exstart", "00:00:35")]
+
+
+def test_interfaces_without_neighbors_are_skipped():
+    for name in ["iosxe_show_ip_ospf_neighbor_detail.json",
+                 "nxos_show_ip_ospf_neighbors_detail.json"]:
+        interfaces = {row["interface"] for row in neighbor_rows(name)}
+        assert not interfaces & {"Loopback0", "loopback0"}
+
+
+def test_rows_belong_to_the_device():
+    output = load_fixture("nxos_show_ip_ospf_neighbors_detail.json")["vrf"]
+    table = network_analytics.parse_ospf_neighbor(output, DEVICE)
+    assert table.devices == [("router1", "192.0.2.1", 3)]
+
+
+def test_walk_schema_benchmark():
+    # 50 areas of 100 interfaces with 4 neighbors each
+    neighbor = load_fixture("nxos_show_ip_ospf_neighbors_detail.json")["vrf"]["default"][
+        "address_family"]["ipv4"]["instance"]["1"]["areas"]["0.0.0.0"]["interfaces"][
+        "Ethernet1/2"]["neighbors"]["10.100.2.2"]
+    areas = {f"0.0.0.{area}": {"interfaces": {
+        f"Ethernet{area}/{interface}": {"neighbors": {
+            f"10.{area}.{interface}.{index}": neighbor for index in range(4)}}
+        for interface in range(100)}} for area in range(50)}
+    output = {"default": {"address_family": {"ipv4": {"instance": {"1": {"areas": areas}}}}}}
+
+    start = time.perf_counter()
+    table = network_analytics.parse_ospf_neighbor(output, DEVICE)
+    elapsed = time.perf_counter() - start
+    assert len(table) == 20000
+    assert elapsed < 1
@@ -0,0 +1,32 @@
+"""
+Write the timings of the profiler to the profile file and to the Prometheus
+metrics.
+"""
+import json
+
+import pytest
+
+import network_analytics
+
+
+def test_records_reach_the_file_at_once(tmp_path):
+    profiler = network_analytics.Profiler()
+    profiler.open(str(tmp_path / "profile.jsonl"))
+    with pytest.raises(TimeoutError):
+        with profiler.timed("execute", "switch1", "show version"):
+            raise TimeoutError("show version timed out")
+
+    # the file is read while the profiler still has it open
+    with open(tmp_path / "profile.jsonl") as profile_file:
+        [record] = [json.loads(line) for line in profile_file]
+    assert (record["device"], record["stage"], record["ok"]) == ("switch1", "execute", False)
+    assert record["error"] == "show version timed out"
+
+
+def test_metric_labels_are_escaped():
+    profiler = network_analytics.Profiler()
+    profiler.record("connect", 'lab "a"\\b\nc', None, 1.5)
+    lines = profiler.metrics().splitlines()
+    assert ('network_analytics_seconds_total{device="lab \\"a\\"\\\\b\\nc",stage="connect",'
+            'command=""} 1.5') in lines
+    assert all(line.startswith(("#", "network_analytics_")) for line in lines)
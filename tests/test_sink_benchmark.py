@@ -0,0 +1,64 @@
+"""
+Write the same fleet to every output format and compare the time taken and
+the size of the files written.
+"""
+import os
+import time
+
+import pytest
+
+import network_analytics
+
+pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+pytest.importorskip("xlsxwriter")
+
+
+def fleet(devices, ports):
+    """
+    :return: list with the interfaces and CPU processes Tables of every device
+    """
+    tables = []
+    for index in range(devices):
+        device = {"name": f"switch{index}", "ip": f"10.0.{index // 256}.{index % 256}"}
+        interfaces = network_analytics.Table(network_analytics.INTERFACE_COLUMNS)
+        for port in range(ports):
+            interfaces.append([f"Ethernet1/{port}", port % 5 != 0, "up", "up", True, 1000000,
+                               1500, "access", port * 10, port * 20])
+        interfaces.add_device(device, ports)
+        cpu_processes = network_analytics.Table(network_analytics.CPU_PROCESS_COLUMNS)
+        for pid in range(ports):
+            cpu_processes.append([pid * 100, pid, f"process{pid}", pid * 3, 7])
+        cpu_processes.add_device(device, ports)
+        tables.append(("NXOS", "interfaces", interfaces))
+        tables.append(("NXOS", "cpu_processes", cpu_processes))
+    return tables
+
+
+def size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _, names in os.walk(path) for name in names)
+
+
+def test_output_format_benchmark(tmp_path):
+    tables = fleet(200, 48)
+    results = {}
+    for name, output_format in network_analytics.OUTPUT_FORMATS.items():
+        path = str(tmp_path / name / output_format["path"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        start = time.perf_counter()
+        sink = output_format["sink"](path, ["NXOS"])
+        for label, table, rows in tables:
+            sink.write(label, table, rows)
+        sink.close()
+        results[name] = (time.perf_counter() - start, size(path))
+
+    for name, (seconds, written) in results.items():
+        print(f"{name}: {seconds:.3f}s {written / 2 ** 10:.0f}KiB")
+    assert all(written for seconds, written in results.values())
+    # the compressed formats are smaller than the workbook
+    assert results["parquet"][1] < results["xlsx"][1]
+    assert results["csv"][1] < results["xlsx"][1]
+    assert results["parquet"][0] < results["xlsx"][0]
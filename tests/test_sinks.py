@@ -0,0 +1,86 @@
+"""
+Write tables whose rows hold different types from run to run to the
+columnar sinks, and read them back as one dataset.
+"""
+import pytest
+
+import network_analytics
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+
+def interfaces(device, bandwidth, mtu):
+    table = network_analytics.Table(network_analytics.INTERFACE_COLUMNS)
+    table.append(["Ethernet1/1", True, "up", "up", True, bandwidth, mtu, "access", 10, 20])
+    table.add_device({"name": device, "ip": "192.0.2.1"}, 1)
+    return table
+
+
+def memory(columns, values):
+    table = network_analytics.Table(columns)
+    table.append(values)
+    table.add_device({"name": "router1", "ip": "192.0.2.1"}, 1)
+    return table
+
+
+def test_parquet_partitions_share_one_schema(tmp_path):
+    first = network_analytics.ParquetSink(str(tmp_path), ["NXOS", "IOS"])
+    first.write("NXOS", "interfaces", interfaces("switch1", 1000000, 1500))
+    first.write("NXOS", "memory_processes",
+                memory(network_analytics.NX_MEMORY_PROCESS_COLUMNS, [1, "init", 100, 50]))
+    first.close()
+    second = network_analytics.ParquetSink(str(tmp_path), ["NXOS", "IOS"])
+    second.run_time = second.run_time.replace(hour=(second.run_time.hour + 1) % 24)
+    second.write("IOS", "interfaces", interfaces("router1", "n/a", "n/a"))
+    second.write("IOS", "memory_processes",
+                 memory(network_analytics.MEMORY_PROCESS_COLUMNS,
+                        [2, "Chunk Manager", 0, 100, 10, 90, 0, 0]))
+    second.close()
+
+    frame = pd.read_parquet(tmp_path / "interfaces")
+    assert sorted(frame["bandwidth"]) == ["1000000", "n/a"]
+    assert sorted(frame["mtu"]) == ["1500", "n/a"]
+    frame = pd.read_parquet(tmp_path / "memory_processes")
+    assert sorted(frame["used"].dropna()) == [50]
+    assert sorted(frame["holding"].dropna()) == [90]
+
+
+def test_parquet_keeps_the_delta_changes(tmp_path):
+    store = network_analytics.SnapshotStore(str(tmp_path / "snapshot.json"))
+    for run, bandwidth in enumerate([1000000, 100000]):
+        parquet = network_analytics.ParquetSink(str(tmp_path / "output"), ["NXOS"])
+        parquet.run_time = parquet.run_time.replace(hour=(parquet.run_time.hour + run) % 24)
+        sink = network_analytics.DeltaSink(parquet, store)
+        sink.write("NXOS", "interfaces", interfaces("switch1", bandwidth, 1500))
+        sink.close()
+
+    frame = pd.read_parquet(tmp_path / "output" / "interfaces")
+    assert list(frame.columns[:3]) == ["change", "device", "ip"]
+    assert sorted(zip(frame["change"], frame["bandwidth"])) == [("added", "1000000"),
+                                                               ("changed", "100000")]
+
+
+def test_arrow_files_share_one_schema(tmp_path):
+    feather = pytest.importorskip("pyarrow.feather")
+    sink = network_analytics.ArrowSink(str(tmp_path), ["NXOS", "IOS"])
+    sink.write("NXOS", "interfaces", interfaces("switch1", 1000000, 1500))
+    sink.write("IOS", "interfaces", interfaces("router1", "n/a", "n/a"))
+    sink.close()
+    nxos, ios = [feather.read_table(str(tmp_path / f"{label}_interfaces.arrow")).schema
+                 for label in ["NXOS", "IOS"]]
+    assert nxos.remove_metadata() == ios.remove_metadata()
+
+
+def test_excel_reports_have_no_error_cells(tmp_path):
+    pytest.importorskip("xlsxwriter")
+    openpyxl = pytest.importorskip("openpyxl")
+    path = str(tmp_path / "report.xlsx")
+    sink = network_analytics.ExcelSink(path, [])
+    sink.write_report("interface_utilization", "Interface Utilization",
+                      pd.DataFrame({"interface": ["Ethernet1/1", "Ethernet1/2"],
+                                    "bandwidth": [1000000.0, float("nan")],
+                                    "utilization": [12.5, float("inf")]}))
+    sink.close()
+    rows = list(openpyxl.load_workbook(path)["Interface Utilization"].values)
+    assert rows[1:] == [("Ethernet1/1", 1000000, 12.5), ("Ethernet1/2", "n/a", "n/a")]
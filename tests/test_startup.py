@@ -0,0 +1,32 @@
+"""
+Import the script in a fresh interpreter, as cron and the shard workers do,
+and check that the heavy packages are left for later.
+"""
+import os
+import subprocess
+import sys
+
+HEAVY_PACKAGES = ["genie", "pyats", "pandas", "numpy", "xlsxwriter"]
+
+# well over the time the standard library takes to import, and well under
+# the time pandas alone takes
+MAX_IMPORT_SECONDS = 0.5
+
+
+def test_import_is_light():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import network_analytics"],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            capture_output=True, text=True, check=True)
+    # every line is "import time: self [us] | cumulative | module", with the
+    # module indented under the module that imported it
+    modules = {}
+    total = 0
+    for line in result.stderr.splitlines()[1:]:
+        self_time, cumulative, name = line.split(":", 1)[1].split("|")
+        modules[name.strip()] = int(cumulative)
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    assert "network_analytics" in modules
+    assert [module for module in modules
+            if module.split(".")[0] in HEAVY_PACKAGES] == []
+    assert total / 1e6 < MAX_IMPORT_SECONDS
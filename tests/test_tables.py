@@ -0,0 +1,197 @@
+"""
+Flatten synthetic Genie outputs into Tables, check that the rows are those
+of the list of dictionaries the parse functions used to return, and
+compare their time and memory.
+"""
+import time
+import tracemalloc
+
+import pytest
+
+import network_analytics
+
+pd = pytest.importorskip("pandas")
+
+DEVICE = {"name": "switch1", "ip": "192.0.2.1"}
+
+
+def interfaces_output(count):
+    interfaces = {}
+    for index in range(count):
+        interface = {"enabled": index % 5 != 0, "oper_status": "up" if index % 5 else "down",
+                     "mtu": 1500, "counters": {"rate": {"in_rate_pkts": index,
+                                                        "out_rate_pkts": index * 2}}}
+        # some of the optional fields are missing, as on real devices
+        if index % 2:
+            interface.update({"admin_state": "up", "auto_negotiate": True,
+                              "bandwidth": 1000000, "port_mode": "access"})
+        if index % 7 == 0:
+            del interface["counters"]
+        interfaces[f"Ethernet1/{index}"] = interface
+    return interfaces
+
+
+def cpu_output(count):
+    return {index: {"invoked": index * 10, "pid": index, "process": f"process{index}",
+                    "runtime_ms": index * 3, "usecs": 7} for index in range(1, count + 1)}
+
+
+def memory_output(count):
+    return {index: {"index": {1: {"pid": index, "process": f"process{index}", "tty": 0,
+                                  "allocated": 1000, "freed": 100, "holding": 900,
+                                  "getbufs": 0, "retbufs": 0}}}
+            for index in range(count)}
+
+
+def nx_memory_output(count):
+    return {index: {"index": {1: {"pid": index, "process": f"process{index}",
+                                  "mem_alloc": 1000, "mem_used": 900}}}
+            for index in range(count)}
+
+
+# the parse functions as they were before the Tables, building a dictionary
+# for every row
+def old_parse_interfaces(interfaces, device):
+    interface_list = []
+    for interface in interfaces:
+        interface_info = {}
+        interface_info["device"] = device["name"]
+        interface_info["ip"] = device["ip"]
+        interface_info["interface"] = interface
+        interface_info["enabled"] = interfaces[interface]["enabled"]
+        interface_info["oper_status"] = interfaces[interface]["oper_status"]
+        for field in ["admin_state", "auto_negotiate", "bandwidth", "mtu", "port_mode"]:
+            if field in interfaces[interface].keys():
+                interface_info[field] = interfaces[interface][field]
+            else:
+                interface_info[field] = "n/a"
+        for column, field in [("out_rate", "out_rate_pkts"), ("in_rate", "in_rate_pkts")]:
+            if ("counters" in interfaces[interface].keys()
+                    and "rate" in interfaces[interface]["counters"].keys()
+                    and field in interfaces[interface]["counters"]["rate"].keys()):
+                interface_info[column] = interfaces[interface]["counters"]["rate"][field]
+            else:
+                interface_info[column] = "n/a"
+        interface_list.append(interface_info)
+    return interface_list
+
+
+def old_parse_cpu_process(cpu_processes, device):
+    cpu_process_list = []
+    for key in cpu_processes:
+        cpu_process_info = {}
+        cpu_process_info["device"] = device["name"]
+        cpu_process_info["ip"] = device["ip"]
+        cpu_process_info["invoked"] = cpu_processes[key]["invoked"]
+        cpu_process_info["p_id"] = cpu_processes[key]["pid"]
+        cpu_process_info["process"] = cpu_processes[key]["process"]
+        cpu_process_info["runtime"] = cpu_processes[key]["runtime_ms"]
+        cpu_process_info["usecs"] = cpu_processes[key]["usecs"]
+        cpu_process_list.append(cpu_process_info)
+    return cpu_process_list
+
+
+def old_parse_memory_process(memory_processes, device):
+    memory_process_list = []
+    for key in memory_processes:
+        for index in memory_processes[key]["index"]:
+            memory_process_info = {"device": device["name"], "ip": device["ip"]}
+            process = memory_processes[key]["index"][index]
+            memory_process_info["p_id"] = process["pid"]
+            for field in ["process", "tty", "allocated", "freed", "holding", "getbufs",
+                          "retbufs"]:
+                memory_process_info[field] = process[field]
+            memory_process_list.append(memory_process_info)
+    return memory_process_list
+
+
+def old_parse_nx_memory_process(memory_processes, device):
+    memory_process_list = []
+    for key in memory_processes:
+        for index in memory_processes[key]["index"]:
+            process = memory_processes[key]["index"][index]
+            memory_process_list.append({"device": device["name"], "ip": device["ip"],
+                                        "p_id": process["pid"], "process": process["process"],
+                                        "allocated": process["mem_alloc"],
+                                        "used": process["mem_used"]})
+    return memory_process_list
+
+
+PARSERS = [
+    (network_analytics.parse_interfaces, old_parse_interfaces, interfaces_output),
+    (network_analytics.parse_cpu_process, old_parse_cpu_process, cpu_output),
+    (network_analytics.parse_memory_process, old_parse_memory_process, memory_output),
+    (network_analytics.parse_nx_memory_process, old_parse_nx_memory_process, nx_memory_output)
+]
+
+
+@pytest.mark.parametrize("parser, old_parser, output", PARSERS)
+def test_rows_match_the_dictionaries(parser, old_parser, output):
+    payload = output(50)
+    assert list(parser(payload, DEVICE).rows()) == old_parser(payload, DEVICE)
+
+
+@pytest.mark.parametrize("parser, old_parser, output", PARSERS)
+def test_frame_matches_the_dictionaries(parser, old_parser, output):
+    payload = output(50)
+    frame = parser(payload, DEVICE).to_frame()
+    old_frame = pd.DataFrame.from_dict(old_parser(payload, DEVICE))
+    assert list(frame.columns) == list(old_frame.columns)
+    assert frame.astype(object).equals(old_frame.astype(object))
+    assert frame["device"].dtype == "category"
+    assert frame["ip"].dtype == "category"
+
+
+def test_records_and_extend():
+    first = network_analytics.Table(["p_id", "process"])
+    first.append([1, "init"])
+    first.append([2, "sshd"])
+    first.add_device(DEVICE, 2)
+    second = network_analytics.Table(["p_id", "process"])
+    second.add_device({"name": "switch2", "ip": "192.0.2.2"}, 0)
+    second.append([1, "init"])
+    second.add_device({"name": "switch3", "ip": "192.0.2.3"}, 1)
+    first.extend(second)
+    assert len(first) == 3
+    assert list(first.records()) == [["switch1", "192.0.2.1", 1, "init"],
+                                     ["switch1", "192.0.2.1", 2, "sshd"],
+                                     ["switch3", "192.0.2.3", 1, "init"]]
+    frame = first.to_frame()
+    assert list(frame["device"]) == ["switch1", "switch1", "switch3"]
+    assert list(frame["ip"].cat.categories) == ["192.0.2.1", "192.0.2.2", "192.0.2.3"]
+
+
+def measure(flatten, payloads):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = flatten(payloads)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return elapsed, peak
+
+
+def test_flattening_benchmark():
+    # the interfaces of 600 devices with 48 ports each
+    payloads = [({"name": f"switch{index}", "ip": f"10.0.{index // 256}.{index % 256}"},
+                 interfaces_output(48)) for index in range(600)]
+
+    def old_flatten(payloads):
+        rows = []
+        for device, payload in payloads:
+            rows.extend(old_parse_interfaces(payload, device))
+        return pd.DataFrame.from_dict(rows)
+
+    def flatten(payloads):
+        table = network_analytics.Table(network_analytics.INTERFACE_COLUMNS)
+        for device, payload in payloads:
+            table.extend(network_analytics.parse_interfaces(payload, device))
+        return table.to_frame()
+
+    old_elapsed, old_peak = measure(old_flatten, payloads)
+    elapsed, peak = measure(flatten, payloads)
+    print(f"dictionaries: {old_elapsed:.3f}s {old_peak / 2 ** 20:.1f}MiB, "
+          f"tables: {elapsed:.3f}s {peak / 2 ** 20:.1f}MiB")
+    assert peak < old_peak / 2
+    assert elapsed < old_elapsed
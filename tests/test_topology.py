@@ -0,0 +1,83 @@
+"""
+Build the OSPF graph of a small fleet and check its reports, including
+when the daemon writes the devices to different sinks.
+"""
+import pytest
+
+import network_analytics
+
+pytest.importorskip("pandas")
+
+# a line of routers r0 - r1 - r2, where r1 is the only path between the others
+LINKS = [("r0", "r1", "10.0.1"), ("r1", "r2", "10.0.2")]
+
+
+def router_tables(router, states=None):
+    states = states or {}
+    neighbors = network_analytics.Table(network_analytics.OSPF_NEIGHBOR_COLUMNS)
+    addresses = network_analytics.Table(network_analytics.INTERFACE_ADDRESS_COLUMNS)
+    for first, second, subnet in LINKS:
+        for local, peer, local_host, peer_host in [(first, second, 1, 2), (second, first, 2, 1)]:
+            if local != router:
+                continue
+            interface = f"to-{peer}"
+            addresses.append([interface, f"{subnet}.{local_host}", "30"])
+            neighbors.append(["default", "1", "0.0.0.0", interface, f"{peer}-id", f"{peer}-id",
+                              f"{subnet}.{peer_host}", states.get(peer, "full"), 1, "n/a",
+                              "n/a", "00:00:35"])
+    device = {"name": router, "ip": "192.0.2.1"}
+    neighbors.add_device(device, len(neighbors))
+    addresses.add_device(device, len(addresses))
+    return {"ospf_neighbors": neighbors, "interface_addresses": addresses}
+
+
+def latest_rows():
+    return network_analytics.LatestRows(
+        {"ospf_neighbors": network_analytics.OSPF_NEIGHBOR_COLUMNS,
+         "interface_addresses": network_analytics.INTERFACE_ADDRESS_COLUMNS})
+
+
+def write(sink, router, states=None):
+    for table, rows in router_tables(router, states).items():
+        sink.write("IOS", table, rows)
+
+
+def test_reports(sink):
+    latest = latest_rows()
+    topology = network_analytics.TopologySink(sink, latest)
+    for router in ["r0", "r1", "r2"]:
+        write(topology, router, {"r0": "init"} if router == "r1" else None)
+    topology.close()
+    assert sink.reports["ospf_one_sided"].empty
+    assert list(sink.reports["ospf_not_full"]["device"]) == ["r1"]
+    assert list(sink.reports["ospf_cut_routers"]["router"]) == ["r1"]
+    assert list(sink.reports["ospf_cut_routers"]["router_id"]) == ["r1-id"]
+    assert sorted(sink.reports["ospf_areas"]["neighbors"]) == [1, 1, 2]
+
+
+def test_one_sided_adjacency(sink):
+    latest = latest_rows()
+    topology = network_analytics.TopologySink(sink, latest)
+    write(topology, "r0")
+    write(topology, "r1")
+    # r2 lost its neighbors but its interfaces are still known
+    tables = router_tables("r2")
+    empty = network_analytics.Table(network_analytics.OSPF_NEIGHBOR_COLUMNS)
+    empty.add_device({"name": "r2", "ip": "192.0.2.1"}, 0)
+    topology.write("IOS", "ospf_neighbors", empty)
+    topology.write("IOS", "interface_addresses", tables["interface_addresses"])
+    topology.close()
+    one_sided = sink.reports["ospf_one_sided"]
+    assert list(zip(one_sided["device"], one_sided["peer"])) == [("r1", "r2")]
+
+
+def test_graph_outlives_the_daemon_flushes(make_sink):
+    latest = latest_rows()
+    for router in ["r0", "r1", "r2"]:
+        # every flush of the daemon writes a single router to a new sink
+        sink = make_sink()
+        topology = network_analytics.TopologySink(sink, latest)
+        write(topology, router)
+        topology.close()
+    assert sink.reports["ospf_one_sided"].empty
+    assert list(sink.reports["ospf_cut_routers"]["router"]) == ["r1"]
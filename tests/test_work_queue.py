@@ -0,0 +1,61 @@
+"""
+Lease, complete and merge the devices of a sharded collection through the
+SQLite work queue.
+"""
+import math
+import time
+
+import network_analytics
+
+
+def counters(device):
+    table = network_analytics.Table(network_analytics.INTERFACE_COUNTER_COLUMNS)
+    table.append(["Ethernet1/1", 1000000, 10, 20, 1, 2, math.nan, 0])
+    table.add_device({"name": device, "ip": "192.0.2.1"}, 1)
+    return table
+
+
+def test_results_round_trip_as_json(tmp_path, make_device):
+    work_queue = network_analytics.WorkQueue(str(tmp_path / "queue.db"))
+    work_queue.enqueue({"router1": make_device()}, 2)
+    device = work_queue.claim(0, "worker", 60)
+    work_queue.complete(device, "worker", "NXOS", {"interface_counters": counters(device)})
+    [(device, label, table, rows)] = work_queue.results()
+    assert (device, label, table) == ("router1", "NXOS", "interface_counters")
+    assert rows.devices == [("router1", "192.0.2.1", 1)]
+    record = list(rows.records())[0]
+    assert record[:3] == ["router1", "192.0.2.1", "Ethernet1/1"]
+    assert math.isnan(record[8])
+    assert work_queue.unfinished() == 0
+
+
+def test_expired_lease_is_not_completed_by_its_old_owner(tmp_path, make_device):
+    work_queue = network_analytics.WorkQueue(str(tmp_path / "queue.db"))
+    work_queue.enqueue({"router1": make_device()}, 1)
+    assert work_queue.claim(0, "first", 0.01) == "router1"
+    time.sleep(0.05)
+    assert work_queue.claim(0, "second", 60) == "router1"
+    work_queue.complete("router1", "first", "IOS", {"interface_counters": counters("router1")})
+    work_queue.fail("router1", "first", "too late")
+    assert list(work_queue.results()) == []
+    assert work_queue.unfinished_devices() == [("router1", "leased")]
+
+
+def test_devices_run_out_of_attempts(tmp_path, make_device):
+    work_queue = network_analytics.WorkQueue(str(tmp_path / "queue.db"), max_attempts=2)
+    work_queue.enqueue({"router1": make_device()}, 1)
+    for attempt in range(2):
+        work_queue.fail(work_queue.claim(0, "worker", 60), "worker", "unreachable")
+    assert work_queue.claim(0, "worker", 60) is None
+    assert work_queue.failed() == [("router1", "unreachable")]
+
+
+def test_merge_reports_unfinished_devices(tmp_path, capsys, make_device, sink):
+    work_queue = network_analytics.WorkQueue(str(tmp_path / "queue.db"))
+    work_queue.enqueue({"router1": make_device(), "router2": make_device()}, 1)
+    device = work_queue.claim(0, "worker", 60)
+    work_queue.complete(device, "worker", "IOS", {"interface_counters": counters(device)})
+    network_analytics.merge_shards(work_queue, sink)
+    assert [table for label, table, rows in sink.writes] == ["interface_counters"]
+    other = ({"router1", "router2"} - {device}).pop()
+    assert f"{other} was not collected, it is still pending" in capsys.readouterr().out